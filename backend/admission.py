@@ -0,0 +1,258 @@
+# backend/admission.py
+
+import os
+import time
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+from . import metrics, workers
+
+# --- Konfiguration ---
+# Gleichzeitige Aufrufe pro Route und wie viele Anfragen zusätzlich auf einen Slot warten dürfen
+UPSTREAM_ROUTE_LIMITS = {
+    "default": (16, 32),
+    "stt": (8, 16),
+    "tts": (8, 16),
+    "describe_image": (4, 8),
+    "create_chat": (16, 32),
+    "message": (16, 32),
+    "message_stream": (16, 16),
+    "sync": (8, 16),
+    "stream_audio": (8, 8),
+}
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "5"))
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "2"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+# Antworten langsamer als dieser Wert zählen als Fehler (Latenzspitze); gilt nicht für Streaming-Routen
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "20"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+
+STREAMING_ROUTES = {"message_stream", "stream_audio"}
+
+
+def _route_limits(route: str):
+    """
+    Überschreibbar per Env, z.B. UPSTREAM_LIMIT_STT=4 und UPSTREAM_QUEUE_STT=8. Die Werte gelten für die
+    ganze Installation und werden auf die Worker-Prozesse aufgeteilt.
+    """
+    concurrency, queue = UPSTREAM_ROUTE_LIMITS.get(route, UPSTREAM_ROUTE_LIMITS["default"])
+    concurrency = int(os.getenv(f"UPSTREAM_LIMIT_{route.upper()}", str(concurrency)))
+    queue = int(os.getenv(f"UPSTREAM_QUEUE_{route.upper()}", str(queue)))
+    return workers.per_worker(concurrency), workers.per_worker(queue)
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(exc: Optional[BaseException]) -> bool:
+    """Nur Netzwerkfehler, Timeouts und 5xx sprechen gegen den AI-Server; 4xx sind Fehler des Aufrufers."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """
+    Closed -> Open nach BREAKER_FAILURE_THRESHOLD Fehlern in Folge. Nach BREAKER_OPEN_SECONDS wird
+    half-open: genau ein Probe-Aufruf darf durch; Erfolg schließt, Fehler öffnet erneut.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """Gibt zurück, ob der Aufruf der Probe-Aufruf ist; wirft UpstreamUnavailable, wenn offen."""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise UpstreamUnavailable("AI service circuit is open", max(1, int(remaining + 0.999)))
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                self.rejected += 1
+                raise UpstreamUnavailable("AI service is being probed", UPSTREAM_RETRY_AFTER)
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            print("Circuit Breaker: AI-Server antwortet wieder, Zustand 'closed'.")
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                print(f"Circuit Breaker: {self.consecutive_failures} Fehler in Folge, "
+                      f"AI-Server für {self.open_seconds:.0f}s gesperrt.")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RouteGate:
+    """Begrenzt gleichzeitige Aufrufe einer Route; ist auch die Warteschlange voll, wird sofort abgelehnt."""
+
+    def __init__(self, route: str, concurrency: int, max_waiting: int):
+        self.route = route
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self._slots = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise UpstreamUnavailable(f"Too many concurrent '{self.route}' requests", UPSTREAM_RETRY_AFTER)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), UPSTREAM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise UpstreamUnavailable(f"Timed out waiting for a '{self.route}' slot", UPSTREAM_RETRY_AFTER)
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+        }
+
+
+class Admission:
+    """
+    Ein zugelassener Upstream-Aufruf. Als Context-Manager gibt er den Slot frei und meldet das Ergebnis
+    an den Breaker. Fängt der Aufrufer Fehler selbst ab, meldet er sie vorher mit observe().
+    """
+
+    def __init__(self, route: str, gate: RouteGate, breaker: CircuitBreaker, probe: bool):
+        self.route = route
+        self._gate = gate
+        self._breaker = breaker
+        self._probe = probe
+        self._started = time.monotonic()
+        self._failed: Optional[bool] = None
+        self._released = False
+
+    def observe(self, exc: Optional[BaseException]):
+        if self._failed is None:
+            self._failed = is_upstream_failure(exc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(exc)
+        return False
+
+    def release(self, exc: Optional[BaseException] = None):
+        if self._released:
+            return
+        self._released = True
+        self._gate.release()
+        if self._probe:
+            self._breaker.probe_in_flight = False
+        elapsed = time.monotonic() - self._started
+        if isinstance(exc, asyncio.CancelledError):
+            # Abbruch durch den Client sagt nichts über den AI-Server aus
+            metrics.upstream_duration.observe(elapsed, route=self.route, outcome="cancelled")
+            return
+        if exc is not None:
+            self.observe(exc)
+        if self._failed:
+            outcome = "error"
+            self._breaker.record_failure()
+        elif self.route not in STREAMING_ROUTES and elapsed > BREAKER_SLOW_CALL_SECONDS:
+            outcome = "slow"
+            print(f"Upstream '{self.route}' brauchte {elapsed:.1f}s, zählt als Fehler.")
+            self._breaker.record_failure()
+        else:
+            outcome = "ok"
+            self._breaker.record_success()
+        metrics.upstream_duration.observe(elapsed, route=self.route, outcome=outcome)
+
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_OPEN_SECONDS)
+_gates: Dict[str, RouteGate] = {}
+
+
+def _gate_for(route: str) -> RouteGate:
+    gate = _gates.get(route)
+    if gate is None:
+        gate = _gates[route] = RouteGate(route, *_route_limits(route))
+    return gate
+
+
+async def admit(route: str) -> Admission:
+    """Reserviert einen Slot für einen Aufruf an den AI-Server oder wirft UpstreamUnavailable."""
+    try:
+        probe = breaker.before_call()
+    except UpstreamUnavailable:
+        metrics.upstream_rejected.inc(route=route, reason="circuit_open")
+        raise
+    gate = _gate_for(route)
+    try:
+        await gate.acquire()
+    except BaseException as e:
+        if probe:
+            breaker.probe_in_flight = False
+        if isinstance(e, UpstreamUnavailable):
+            metrics.upstream_rejected.inc(route=route, reason="overloaded")
+        raise
+    return Admission(route, gate, breaker, probe)
+
+
+def _collect_metrics():
+    state = metrics.Gauge("coldnet_upstream_breaker_open", "1 while the AI server circuit breaker rejects calls.")
+    state.set(0 if breaker.state == CircuitBreaker.CLOSED else 1)
+    in_flight = metrics.Gauge("coldnet_upstream_in_flight", "AI server calls in progress.", ("route",))
+    waiting = metrics.Gauge("coldnet_upstream_waiting", "Requests queued for an AI server slot.", ("route",))
+    for route, gate in list(_gates.items()):
+        in_flight.set(gate.in_flight, route=route)
+        waiting.set(gate.waiting, route=route)
+    return [state, in_flight, waiting]
+
+
+metrics.registry.add_collector(_collect_metrics)
+
+
+def stats() -> Dict[str, object]:
+    return {"breaker": breaker.stats(), "routes": {route: gate.stats() for route, gate in _gates.items()}}
@@ -0,0 +1,385 @@
+# backend/archive.py
+
+import os
+import time
+import zlib
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import delete, desc, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from . import fastresponse, models, workers
+from .models import AsyncSessionLocal, SessionLocal, engine
+
+try:
+    import zstandard
+except ImportError:  # zstandard ist optional; ohne wird mit zlib komprimiert
+    zstandard = None
+
+# Ältere Nachrichten wandern segmentweise (ARCHIVE_SEGMENT_MESSAGES, aufsteigende IDs) als komprimiertes
+# JSON in message_archive. Archiviert wird immer der älteste Teil eines Chats, daher bleiben Verlauf und
+# Keyset-Pagination einfach: erst messages, dann die Segmente mit kleineren IDs.
+# Der Lösch-Trigger nimmt archivierte Nachrichten aus messages_fts; ihr Text wird beim Archivieren in
+# message_archive_fts (Migration 8) eingetragen, die Suche (search.py) fragt beide Indizes ab.
+
+# --- Konfiguration ---
+# Nachrichten älter als so viele Tage archivieren (0 = aus); gilt nur für Zeilen mit created_at
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("ARCHIVE_MAX_AGE_DAYS", "90"))
+# Pro Chat höchstens so viele Nachrichten in messages behalten (0 = aus)
+ARCHIVE_KEEP_LAST = int(os.getenv("ARCHIVE_KEEP_LAST", "1000"))
+# Kleinere Mengen werden nicht archiviert (vermeidet winzige Segmente)
+ARCHIVE_MIN_MESSAGES = int(os.getenv("ARCHIVE_MIN_MESSAGES", "100"))
+ARCHIVE_SEGMENT_MESSAGES = int(os.getenv("ARCHIVE_SEGMENT_MESSAGES", "500"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_INITIAL_DELAY = float(os.getenv("ARCHIVE_INITIAL_DELAY", "60"))
+ARCHIVE_ZLIB_LEVEL = int(os.getenv("ARCHIVE_ZLIB_LEVEL", "9"))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+# incremental_vacuum: erst ab so vielen freien Seiten, in Schritten mit Pause (damit Schreiber dazwischen kommen)
+VACUUM_MIN_FREE_PAGES = int(os.getenv("VACUUM_MIN_FREE_PAGES", "256"))
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "512"))
+VACUUM_STEP_PAUSE = float(os.getenv("VACUUM_STEP_PAUSE", "0.05"))
+# Bestehende Datenbanken ohne auto_vacuum einmalig per VACUUM umstellen. Das sperrt die Datei für die ganze
+# Dauer und gehört in ein Wartungsfenster (python -m backend.serve --convert-vacuum bei gestopptem Server);
+# im laufenden Server nur, wenn ausdrücklich eingeschaltet.
+VACUUM_CONVERT = os.getenv("VACUUM_CONVERT", "0") == "1"
+
+
+class ArchivedMessage(NamedTuple):
+    id: int
+    chat_id: int
+    content: str
+    sender: str
+    image_hash: Optional[str]
+    image_inline: Optional[str]
+    media_type: Optional[str] = None
+
+    @property
+    def image_data(self) -> Optional[str]:
+        if self.image_hash:
+            return f"{models.BLOB_URL_PREFIX}{self.image_hash}"
+        return self.image_inline
+
+
+# --- Segmente ---
+def compress_segment(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ARCHIVE_ZLIB_LEVEL)
+
+
+def decompress_segment(codec: str, payload: bytes) -> List[list]:
+    """Liefert die Zeilen eines Segments als [id, content, sender, image_hash, image_inline]."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive segment uses zstd, but the zstandard module is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == "zlib":
+        raw = zlib.decompress(payload)
+    else:
+        raise RuntimeError(f"Unknown archive codec {codec!r}")
+    return fastresponse.loads(raw)
+
+
+def media_types(db: Session, hashes: Iterable[str]) -> Dict[str, str]:
+    hashes = {h for h in hashes if h}
+    if not hashes:
+        return {}
+    result = db.execute(select(models.Blob.hash, models.Blob.media_type).where(models.Blob.hash.in_(hashes)))
+    return dict(result.all())
+
+
+def load_archived(db: Session, chat_id: int, before_id: Optional[int] = None, limit: Optional[int] = None,
+                  with_media_type: bool = False) -> List[ArchivedMessage]:
+    """
+    Archivierte Nachrichten eines Chats in aufsteigender ID-Reihenfolge. Mit limit nur die neuesten limit
+    Nachrichten vor before_id; dafür werden nur so viele Segmente wie nötig entpackt (neueste zuerst).
+    """
+    query = (
+        select(models.MessageArchive.codec, models.MessageArchive.payload)
+        .where(models.MessageArchive.chat_id == chat_id)
+        .order_by(desc(models.MessageArchive.first_id))
+    )
+    if before_id is not None:
+        query = query.where(models.MessageArchive.first_id < before_id)
+    segments: List[List[list]] = []
+    count = 0
+    result = db.execute(query)
+    try:
+        for codec, payload in result:
+            rows = decompress_segment(codec, payload)
+            if before_id is not None:
+                rows = [row for row in rows if row[0] < before_id]
+            segments.append(rows)
+            count += len(rows)
+            if limit is not None and count >= limit:
+                break
+    finally:
+        result.close()
+    rows = [row for segment in reversed(segments) for row in segment]
+    if limit is not None:
+        rows = rows[-limit:] if limit > 0 else []
+    types = media_types(db, (row[3] for row in rows)) if with_media_type else {}
+    return [ArchivedMessage(row[0], chat_id, row[1], row[2], row[3], row[4], types.get(row[3])) for row in rows]
+
+
+# rowid ist die ursprüngliche Nachrichten-ID; das Löschen über den ID-Bereich eines Segments bleibt ein
+# Range-Scan, chat_id trennt Nachrichten anderer Chats, die im selben Bereich liegen
+_INDEX_ARCHIVED_SQL = text(
+    "INSERT INTO message_archive_fts(rowid, content, chat_id, sender) VALUES (:id, :content, :chat_id, :sender)"
+)
+_UNINDEX_ARCHIVED_SQL = text(
+    "DELETE FROM message_archive_fts WHERE rowid BETWEEN :first_id AND :last_id AND chat_id = :chat_id"
+)
+
+
+def index_archived(db, chat_id: int, rows: Iterable[list]):
+    """Trägt Segmentzeilen [id, content, sender, ...] in den Volltextindex für archivierte Nachrichten ein."""
+    params = [{"id": row[0], "content": row[1], "chat_id": chat_id, "sender": row[2]} for row in rows]
+    if params:
+        db.execute(_INDEX_ARCHIVED_SQL, params)
+
+
+def delete_archived(db: Session, chat_ids: List[int]):
+    segments = db.execute(
+        select(models.MessageArchive.chat_id, models.MessageArchive.first_id, models.MessageArchive.last_id)
+        .where(models.MessageArchive.chat_id.in_(chat_ids))
+    ).all()
+    if segments:
+        db.execute(_UNINDEX_ARCHIVED_SQL,
+                   [{"chat_id": chat_id, "first_id": first_id, "last_id": last_id}
+                    for chat_id, first_id, last_id in segments])
+    db.execute(delete(models.MessageArchive).where(models.MessageArchive.chat_id.in_(chat_ids)))
+
+
+# --- Archivierung ---
+def _cutoff() -> Optional[datetime]:
+    if ARCHIVE_MAX_AGE_DAYS <= 0:
+        return None
+    return datetime.utcnow() - timedelta(days=ARCHIVE_MAX_AGE_DAYS)
+
+
+def _candidate_chats(db: Session, cutoff: Optional[datetime]) -> Set[int]:
+    chat_ids: Set[int] = set()
+    if ARCHIVE_KEEP_LAST > 0:
+        chat_ids.update(db.execute(
+            select(models.Message.chat_id)
+            .group_by(models.Message.chat_id)
+            .having(func.count() >= ARCHIVE_KEEP_LAST + ARCHIVE_MIN_MESSAGES)
+        ).scalars())
+    if cutoff is not None:
+        chat_ids.update(db.execute(
+            select(models.Message.chat_id)
+            .where(models.Message.created_at < cutoff)
+            .group_by(models.Message.chat_id)
+            .having(func.count() >= ARCHIVE_MIN_MESSAGES)
+        ).scalars())
+    return chat_ids
+
+
+def _archive_boundary(db: Session, chat_id: int, cutoff: Optional[datetime]) -> Optional[int]:
+    """Höchste ID, die archiviert werden soll (Alter oder jenseits der letzten ARCHIVE_KEEP_LAST)."""
+    boundary = None
+    if ARCHIVE_KEEP_LAST > 0:
+        boundary = db.execute(
+            select(models.Message.id)
+            .where(models.Message.chat_id == chat_id)
+            .order_by(desc(models.Message.id))
+            .offset(ARCHIVE_KEEP_LAST)
+            .limit(1)
+        ).scalar()
+    if cutoff is not None:
+        aged = db.execute(
+            select(func.max(models.Message.id))
+            .where(models.Message.chat_id == chat_id, models.Message.created_at < cutoff)
+        ).scalar()
+        if aged is not None and (boundary is None or aged > boundary):
+            boundary = aged
+    return boundary
+
+
+def _move_segment(db: Session, chat_id: int, boundary: int) -> int:
+    rows = db.execute(
+        select(models.Message.id, models.Message.content, models.Message.sender,
+               models.Message.image_hash, models.Message.image_data_inline)
+        .where(models.Message.chat_id == chat_id, models.Message.id <= boundary)
+        .order_by(models.Message.id)
+        .limit(ARCHIVE_SEGMENT_MESSAGES)
+    ).all()
+    if not rows:
+        return 0
+    raw = fastresponse.dumps([list(row) for row in rows])
+    codec, payload = compress_segment(raw)
+    first_id, last_id = rows[0][0], rows[-1][0]
+    db.execute(insert(models.MessageArchive).values(
+        chat_id=chat_id, first_id=first_id, last_id=last_id, message_count=len(rows),
+        codec=codec, raw_size=len(raw), payload=payload,
+    ))
+    index_archived(db, chat_id, rows)
+    db.execute(
+        delete(models.Message)
+        .where(models.Message.chat_id == chat_id, models.Message.id.between(first_id, last_id))
+    )
+    return len(rows)
+
+
+def archive_messages() -> Tuple[int, int]:
+    """Ein Archivierungslauf (synchron, im Thread). Liefert (archivierte Nachrichten, neue Segmente)."""
+    cutoff = _cutoff()
+    with SessionLocal() as db:
+        chat_ids = sorted(_candidate_chats(db, cutoff))
+    archived = segments = 0
+    for chat_id in chat_ids:
+        try:
+            with SessionLocal() as db:
+                boundary = _archive_boundary(db, chat_id, cutoff)
+                if boundary is None:
+                    continue
+                pending = db.execute(
+                    select(func.count())
+                    .where(models.Message.chat_id == chat_id, models.Message.id <= boundary)
+                ).scalar()
+            if pending < ARCHIVE_MIN_MESSAGES:
+                continue
+            # Ein Segment pro Transaktion, damit die Schreibsperre jeweils nur kurz gehalten wird
+            while True:
+                with SessionLocal() as db:
+                    moved = _move_segment(db, chat_id, boundary)
+                    db.commit()
+                if not moved:
+                    break
+                archived += moved
+                segments += 1
+        except Exception as e:
+            # z.B. gesperrte Datenbank; der nächste Lauf versucht es erneut
+            print(f"Archivierung von Chat {chat_id} fehlgeschlagen: {e}")
+    return archived, segments
+
+
+def _convert_auto_vacuum(conn) -> int:
+    print("Stelle die Datenbank auf auto_vacuum=INCREMENTAL um (einmaliges VACUUM)...")
+    conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+    before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    conn.exec_driver_sql("VACUUM")
+    return before - conn.exec_driver_sql("PRAGMA page_count").scalar()
+
+
+def convert_auto_vacuum() -> int:
+    """Wartungsschritt: stellt eine bestehende Datenbank auf auto_vacuum=INCREMENTAL um (0 = war schon so)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return 0
+        return _convert_auto_vacuum(conn)
+
+
+def incremental_vacuum() -> int:
+    """Gibt freie Seiten schrittweise an das Dateisystem zurück. Liefert die Anzahl freigegebener Seiten."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            # Ohne auto_vacuum hilft incremental_vacuum nicht; freie Seiten werden nur wiederverwendet
+            return _convert_auto_vacuum(conn) if VACUUM_CONVERT else 0
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if free < VACUUM_MIN_FREE_PAGES:
+            return 0
+        freed = 0
+        # sqlite3 führt PRAGMA incremental_vacuum per execute() nur einen Schritt aus, executescript() komplett
+        dbapi_connection = conn.connection.driver_connection
+        while free > 0:
+            dbapi_connection.executescript(f"PRAGMA incremental_vacuum({min(free, VACUUM_STEP_PAGES)});")
+            remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+            time.sleep(VACUUM_STEP_PAUSE)
+        # WAL-Datei nach dem Umbau wieder verkleinern
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return freed
+
+
+class Archiver:
+    """Hintergrund-Task: archiviert regelmäßig alte Nachrichten und gibt danach freien Platz zurück."""
+
+    def __init__(self, interval: float, initial_delay: float):
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.errors = 0
+        self.archived_messages = 0
+        self.segments_written = 0
+        self.vacuumed_pages = 0
+        self.last_run: Optional[datetime] = None
+        self.last_duration = 0.0
+        # Bei mehreren Workern archiviert nur der Halter des Locks; stirbt er, übernimmt ein anderer
+        self._lock = workers.ProcessLock("archiver")
+
+    def enabled(self) -> bool:
+        return self.interval > 0 and (ARCHIVE_KEEP_LAST > 0 or ARCHIVE_MAX_AGE_DAYS > 0)
+
+    def start(self):
+        if self.enabled() and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._lock.release()
+
+    def run_once(self):
+        started = time.perf_counter()
+        archived, segments = archive_messages()
+        self.archived_messages += archived
+        self.segments_written += segments
+        self.vacuumed_pages += incremental_vacuum()
+        self.runs += 1
+        self.last_run = datetime.utcnow()
+        self.last_duration = time.perf_counter() - started
+        if archived:
+            print(f"Archivierung: {archived} Nachrichten in {segments} Segmente verschoben "
+                  f"({self.last_duration:.1f}s)")
+
+    async def _run(self):
+        await asyncio.sleep(self.initial_delay)
+        while True:
+            try:
+                if self._lock.try_acquire():
+                    await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.errors += 1
+                print(f"Archivierung fehlgeschlagen: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stats(self) -> Dict[str, object]:
+        async with AsyncSessionLocal() as db:
+            segments, messages, raw_size, stored_size = (await db.execute(select(
+                func.count(), func.coalesce(func.sum(models.MessageArchive.message_count), 0),
+                func.coalesce(func.sum(models.MessageArchive.raw_size), 0),
+                func.coalesce(func.sum(func.length(models.MessageArchive.payload)), 0),
+            ))).one()
+            hot_messages = (await db.execute(select(func.count()).select_from(models.Message))).scalar()
+        return {
+            "enabled": self.enabled(),
+            "active_worker": self._lock.held,
+            "codec": "zstd" if zstandard is not None else "zlib",
+            "segments": segments,
+            "archived_messages": messages,
+            "hot_messages": hot_messages,
+            "raw_bytes": raw_size,
+            "stored_bytes": stored_size,
+            "runs": self.runs,
+            "errors": self.errors,
+            "moved_since_start": self.archived_messages,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_duration_ms": round(self.last_duration * 1000, 1),
+        }
+
+
+archiver = Archiver(ARCHIVE_INTERVAL, ARCHIVE_INITIAL_DELAY)
@@ -0,0 +1,208 @@
+# backend/audio.py
+
+import os
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+
+from fastapi import UploadFile
+
+from . import metrics
+
+# --- Konfiguration ---
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# Maximale Anzahl gleichzeitig laufender ffmpeg-Prozesse.
+FFMPEG_MAX_WORKERS = int(os.getenv("FFMPEG_MAX_WORKERS", str(os.cpu_count() or 2)))
+CHUNK_SIZE = 64 * 1024
+NORMALIZE_FILTER = "dynaudnorm=f=150:g=15,volume=3dB"
+# Obergrenze für eine über den WebSocket gestreamte Äußerung (wird für den Fallback ohne Filter gepuffert)
+VOICE_MAX_UTTERANCE_BYTES = int(os.getenv("VOICE_MAX_UTTERANCE_BYTES", str(16 * 1024 * 1024)))
+
+_ffmpeg_slots = asyncio.Semaphore(FFMPEG_MAX_WORKERS)
+
+
+class FfmpegError(Exception):
+    pass
+
+
+class UtteranceTooLong(Exception):
+    pass
+
+
+class LiveAudioSource:
+    """
+    Audioquelle, die während der Aufnahme befüllt wird (WebSocket). Bietet read()/seek() wie UploadFile,
+    damit ffmpeg schon läuft, während noch gesprochen wird. Die Daten bleiben für einen zweiten Durchlauf erhalten.
+    """
+
+    def __init__(self, max_bytes: int = VOICE_MAX_UTTERANCE_BYTES):
+        self.max_bytes = max_bytes
+        self._data = bytearray()
+        self._pos = 0
+        self._finished = False
+        self._changed = asyncio.Event()
+
+    def feed(self, chunk: bytes):
+        if self._finished:
+            return
+        if len(self._data) + len(chunk) > self.max_bytes:
+            raise UtteranceTooLong(f"Utterance exceeds {self.max_bytes} bytes")
+        self._data += chunk
+        self._changed.set()
+
+    def finish(self):
+        self._finished = True
+        self._changed.set()
+
+    @property
+    def size(self) -> int:
+        return len(self._data)
+
+    async def read(self, size: int = -1) -> bytes:
+        while self._pos >= len(self._data) and not self._finished:
+            self._changed.clear()
+            await self._changed.wait()
+        end = len(self._data) if size < 0 else min(len(self._data), self._pos + size)
+        chunk = bytes(self._data[self._pos:end])
+        self._pos = end
+        return chunk
+
+    async def seek(self, offset: int):
+        self._pos = offset
+
+
+class StageTimer:
+    """Sammelt Laufzeiten der einzelnen Verarbeitungsschritte (in Sekunden)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.since_start() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def pcm_input_args(sample_rate: int) -> List[str]:
+    """ffmpeg-Eingabeoptionen für rohes PCM (16 bit, mono), wie es z.B. ein AudioWorklet liefert."""
+    return ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1"]
+
+
+def ffmpeg_wav_command(audio_filter: Optional[str], input_args: Sequence[str] = ()) -> List[str]:
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0"]
+    if audio_filter:
+        cmd += ["-af", audio_filter]
+    cmd += ["-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", "-f", "wav", "pipe:1"]
+    return cmd
+
+
+async def _feed_stdin(proc: asyncio.subprocess.Process, upload: UploadFile):
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            proc.stdin.write(chunk)
+            await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg hat sich beendet; der Exit-Code wird beim Lesen ausgewertet.
+        pass
+    finally:
+        if not proc.stdin.is_closing():
+            proc.stdin.close()
+
+
+async def _drain_stdout(proc, feeder, first_chunk: bytes, timings: StageTimer,
+                        spawned: float) -> AsyncIterator[bytes]:
+    yield first_chunk
+    while True:
+        chunk = await proc.stdout.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    await feeder
+    returncode = await proc.wait()
+    timings.add("ffmpeg", time.perf_counter() - spawned)
+    if returncode != 0:
+        raise FfmpegError(f"ffmpeg exited with code {returncode}")
+
+
+async def _stop(proc: asyncio.subprocess.Process, feeder: asyncio.Task):
+    if not feeder.done():
+        feeder.cancel()
+    if proc.returncode is None:
+        proc.kill()
+        await proc.wait()
+
+
+@asynccontextmanager
+async def normalized_wav_stream(upload: UploadFile, timings: StageTimer,
+                                input_args: Sequence[str] = ()) -> AsyncIterator[AsyncIterator[bytes]]:
+    """
+    Pipt den Upload durch ffmpeg (16 kHz, mono, PCM-WAV) und liefert dessen stdout als Chunk-Iterator.
+    Schlägt die Normalisierung fehl, bevor Daten kommen, wird ohne Filter erneut konvertiert.
+    upload kann auch eine LiveAudioSource sein.
+    """
+    queued = time.perf_counter()
+    async with _ffmpeg_slots:
+        timings.add("ffmpeg_queue", time.perf_counter() - queued)
+        metrics.ffmpeg_queue.observe(time.perf_counter() - queued)
+        last_error: Optional[Exception] = None
+        for audio_filter in (NORMALIZE_FILTER, None):
+            await upload.seek(0)
+            spawned = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                *ffmpeg_wav_command(audio_filter, input_args),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            feeder = asyncio.create_task(_feed_stdin(proc, upload))
+            try:
+                first_chunk = await proc.stdout.read(CHUNK_SIZE)
+                if not first_chunk:
+                    await feeder
+                    last_error = FfmpegError(f"ffmpeg exited with code {await proc.wait()}")
+                    continue
+                timings.add("ffmpeg_first_byte", time.perf_counter() - spawned)
+                yield _drain_stdout(proc, feeder, first_chunk, timings, spawned)
+                return
+            finally:
+                await _stop(proc, feeder)
+                metrics.ffmpeg_duration.observe(time.perf_counter() - spawned,
+                                                filter="normalize" if audio_filter else "none",
+                                                outcome="ok" if proc.returncode == 0 else "failed")
+        raise last_error
+
+
+async def multipart_file_stream(field: str, filename: str, content_type: str,
+                                chunks: AsyncIterator[bytes], boundary: str) -> AsyncIterator[bytes]:
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def new_multipart_boundary() -> str:
+    return uuid.uuid4().hex
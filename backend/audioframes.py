@@ -0,0 +1,107 @@
+# backend/audioframes.py
+
+import os
+import time
+import struct
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional
+
+# Protokoll des AI-Servers: jeder Frame = 4 Byte Länge (big-endian) + WAV-Daten
+FRAME_HEADER = struct.Struct(">I")
+
+# --- Konfiguration ---
+AUDIO_MAX_FRAME_BYTES = int(os.getenv("AUDIO_MAX_FRAME_BYTES", str(16 * 1024 * 1024)))
+# Anzahl Frames, die zwischen AI-Server und Client gepuffert werden, bevor das Lesen pausiert
+AUDIO_RELAY_QUEUE_FRAMES = int(os.getenv("AUDIO_RELAY_QUEUE_FRAMES", "8"))
+
+
+class FrameProtocolError(Exception):
+    pass
+
+
+class FrameParser:
+    """Zerlegt einen Bytestrom in vollständige Frames (inklusive Längen-Header)."""
+
+    def __init__(self, max_frame_bytes: int = AUDIO_MAX_FRAME_BYTES):
+        self.max_frame_bytes = max_frame_bytes
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self._buffer)
+            if length > self.max_frame_bytes:
+                raise FrameProtocolError(f"Frame of {length} bytes exceeds limit of {self.max_frame_bytes}")
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(bytes(self._buffer[:end]))
+            del self._buffer[:end]
+        return frames
+
+    @property
+    def pending_bytes(self) -> int:
+        return len(self._buffer)
+
+
+@dataclass
+class RelayStats:
+    started: float = field(default_factory=time.perf_counter)
+    first_frame_at: Optional[float] = None
+    frame_sizes: List[int] = field(default_factory=list)
+
+    def record_frame(self, payload_size: int):
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+        self.frame_sizes.append(payload_size)
+
+    @property
+    def time_to_first_frame(self) -> Optional[float]:
+        return None if self.first_frame_at is None else self.first_frame_at - self.started
+
+    def summary(self) -> str:
+        ttff = self.time_to_first_frame
+        ttff_text = "-" if ttff is None else f"{ttff * 1000:.0f}ms"
+        return (f"frames={len(self.frame_sizes)} bytes={sum(self.frame_sizes)} ttff={ttff_text} "
+                f"sizes={self.frame_sizes} total={(time.perf_counter() - self.started) * 1000:.0f}ms")
+
+
+class FrameRelay:
+    """
+    Begrenzte Queue zwischen Upstream-Leser und Client. Ist sie voll, wartet der Leser (Backpressure).
+    Trennt sich der Client, werden weitere Frames verworfen, damit der Leser zu Ende laufen kann.
+    """
+
+    def __init__(self, max_frames: int = AUDIO_RELAY_QUEUE_FRAMES):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_frames)
+        self._consumer_gone = asyncio.Event()
+        self.stats = RelayStats()
+
+    async def _offer(self, item: Optional[bytes]):
+        if self._consumer_gone.is_set():
+            return
+        put = asyncio.ensure_future(self._queue.put(item))
+        gone = asyncio.ensure_future(self._consumer_gone.wait())
+        await asyncio.wait({put, gone}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (put, gone):
+            if not task.done():
+                task.cancel()
+
+    async def send(self, frame: bytes):
+        self.stats.record_frame(len(frame) - FRAME_HEADER.size)
+        await self._offer(frame)
+
+    async def close(self):
+        await self._offer(None)
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                frame = await self._queue.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self._consumer_gone.set()
@@ -7,9 +7,11 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import crud, models, schemas
-from .models import SessionLocal # Importiert jetzt von models.py
+from . import crud_async, models, schemas
+from .models import AsyncSessionLocal, SessionLocal # Importiert jetzt von models.py
+from .usercache import CurrentUser, user_cache
 
 # --- Konfiguration ---
 SECRET_KEY = "a_very_secret_key_for_coldnet"
@@ -29,6 +31,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # --- Abhängigkeiten (Dependencies) ---
+# Endpunkte binden die Sessions mit scope="function" ein: so wird committet, bevor die Antwort
+# rausgeht. Sonst kann z.B. ein Login direkt nach der Registrierung den neuen Benutzer noch nicht sehen.
 def get_db():
     db = SessionLocal()
     try:
@@ -40,8 +44,17 @@ def get_db():
     finally:
         db.close()
 
-# Holt den aktuellen Benutzer aus dem JWT
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except:
+            await db.rollback()
+            raise
+
+# Prüft ein JWT und liefert den Benutzer (nur id/username, gecacht); wirft 401 bei ungültigem Token
+async def resolve_user(db: AsyncSession, token: str) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -56,7 +69,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = crud.get_user_by_username(db, username=token_data.username)
+    cached = user_cache.get(token_data.username)
+    if cached is not None:
+        return cached
+    user = await crud_async.get_user_identity(db, username=token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+    current_user = CurrentUser(id=user.id, username=user.username)
+    user_cache.put(current_user)
+    return current_user
+
+# Holt den aktuellen Benutzer aus dem Authorization-Header
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db, scope="function")) -> CurrentUser:
+    return await resolve_user(db, token)
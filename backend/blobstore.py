@@ -0,0 +1,136 @@
+# backend/blobstore.py
+
+import io
+import os
+import re
+import base64
+import binascii
+import hashlib
+import tempfile
+from typing import Optional, Tuple
+
+from sqlalchemy import insert
+
+from . import models
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow ist optional; ohne wird der Typ nur an der Dateisignatur erkannt
+    Image = None
+
+# --- Konfiguration ---
+# Binärdaten liegen inhaltsadressiert (SHA-256) im Dateisystem, die Metadaten in der Tabelle "blobs".
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(".", "blobs"))
+BLOB_URL_PREFIX = models.BLOB_URL_PREFIX
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Nur diese Bildtypen werden gespeichert. Der Typ wird aus dem Inhalt bestimmt, nie aus der Data-URL:
+# sonst ließe sich z. B. HTML oder SVG als "Bild" hochladen und vom App-Origin ausliefern.
+IMAGE_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "GIF": "image/gif", "WEBP": "image/webp"}
+_SIGNATURES = ((b"\x89PNG\r\n\x1a\n", "PNG"), (b"\xff\xd8\xff", "JPEG"), (b"GIF87a", "GIF"), (b"GIF89a", "GIF"))
+
+
+def is_valid_hash(blob_hash: str) -> bool:
+    return bool(_HASH_RE.match(blob_hash or ""))
+
+
+def blob_path(blob_hash: str) -> str:
+    return os.path.join(BLOB_DIR, blob_hash[:2], blob_hash)
+
+
+def decode_data_url(value: str) -> Tuple[str, bytes]:
+    """Zerlegt "data:image/png;base64,..." (oder reines Base64) in (media_type, bytes)."""
+    media_type = "application/octet-stream"
+    if value.startswith("data:") and "," in value:
+        header, value = value.split(",", 1)
+        media_type = header[len("data:"):].split(";")[0] or media_type
+    try:
+        return media_type, base64.b64decode(value, validate=True)
+    except binascii.Error as e:
+        raise ValueError(str(e))
+
+
+def sniff_image_type(data: bytes) -> str:
+    """Gibt den Media-Type für data zurück; ValueError, wenn es keines der erlaubten Bildformate ist."""
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                image_format = img.format
+                img.verify()
+        except Exception as e:
+            raise ValueError(f"Not a supported image: {e}")
+    else:
+        image_format = next((fmt for signature, fmt in _SIGNATURES if data.startswith(signature)), None)
+        if image_format is None and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            image_format = "WEBP"
+    if image_format not in IMAGE_TYPES:
+        raise ValueError(f"Unsupported image type: {image_format}")
+    return IMAGE_TYPES[image_format]
+
+
+def encode_data_url(media_type: str, data: bytes) -> str:
+    return f"data:{media_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _write_file(blob_hash: str, data: bytes):
+    path = blob_path(blob_hash)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def put_bytes(db, data: bytes) -> str:
+    """
+    Speichert ein Bild (dedupliziert) und gibt den Hash zurück. db darf Session oder Connection sein.
+    Der Media-Type wird aus dem Inhalt bestimmt; alles außer IMAGE_TYPES wird mit ValueError abgelehnt.
+    """
+    media_type = sniff_image_type(data)
+    blob_hash = hashlib.sha256(data).hexdigest()
+    _write_file(blob_hash, data)
+    db.execute(
+        insert(models.Blob)
+        .prefix_with("OR IGNORE")
+        .values(hash=blob_hash, media_type=media_type, size=len(data))
+    )
+    return blob_hash
+
+
+def store_image_value(db, value: Optional[str]) -> Optional[str]:
+    """
+    Nimmt einen Bildwert aus der API entgegen und gibt den Blob-Hash zurück.
+    Akzeptiert Data-URLs/Base64 sowie bereits gespeicherte Blob-URLs (z. B. unverändert zurückgesendete Profilbilder).
+    """
+    if not value:
+        return None
+    if value.startswith(BLOB_URL_PREFIX):
+        blob_hash = value[len(BLOB_URL_PREFIX):]
+        if not is_valid_hash(blob_hash) or not os.path.exists(blob_path(blob_hash)):
+            raise ValueError("Unknown blob reference")
+        return blob_hash
+    _, data = decode_data_url(value)
+    return put_bytes(db, data)
+
+
+def get_blob(db, blob_hash: str) -> Optional[models.Blob]:
+    if not is_valid_hash(blob_hash):
+        return None
+    return db.get(models.Blob, blob_hash)
+
+
+def read_bytes(blob_hash: str) -> bytes:
+    with open(blob_path(blob_hash), "rb") as f:
+        return f.read()
+
+
+def read_data_url(blob: models.Blob) -> str:
+    return encode_data_url(blob.media_type, read_bytes(blob.hash))
@@ -0,0 +1,282 @@
+# backend/chatexport.py
+
+import os
+import zlib
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from . import archive, blobstore, chatpool, crud, fastresponse, models, schemas
+from .models import AsyncSessionLocal
+
+# NDJSON, eine Zeile pro Datensatz:
+#   {"type": "export", "version": 1, "exported_at": "..."}
+#   {"type": "chat", "id": 7, "title": "...", "is_pinned": false}                          (alle Chats zuerst)
+#   {"type": "message", "chat_id": 7, "content": "...", "sender": "user", "image_data": "data:image/png;base64,..."}
+# Die IDs im Export dienen nur der Zuordnung; beim Import bekommen Chats neue IDs und einen neuen AI-Chat.
+# Ein ai_chat_id aus der Datei wird ignoriert: sonst könnte man den AI-Verlauf eines anderen Benutzers übernehmen.
+
+EXPORT_VERSION = 1
+
+# --- Konfiguration ---
+# Zeilen pro Fetch aus dem Cursor (yield_per) und pro gesendetem Chunk
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "500"))
+# Archiv-Segmente pro Fetch (jedes enthält bis zu ARCHIVE_SEGMENT_MESSAGES Nachrichten)
+EXPORT_BATCH_SEGMENTS = int(os.getenv("EXPORT_BATCH_SEGMENTS", "4"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+# Nachrichten pro Insert-Batch und Obergrenze der gepufferten Bytes (Bilder können groß sein)
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "1000"))
+IMPORT_BATCH_BYTES = int(os.getenv("IMPORT_BATCH_BYTES", str(16 * 1024 * 1024)))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(32 * 1024 * 1024)))
+
+
+class ChatImportError(Exception):
+    pass
+
+
+# --- Export ---
+def _image_value(image_hash: Optional[str], media_type: Optional[str], inline: Optional[str], embed: bool):
+    if not image_hash:
+        return inline
+    if not embed:
+        return f"{blobstore.BLOB_URL_PREFIX}{image_hash}"
+    return blobstore.encode_data_url(media_type or "application/octet-stream", blobstore.read_bytes(image_hash))
+
+
+async def export_lines(owner_id: int, embed_images: bool) -> AsyncIterator[bytes]:
+    """
+    Liefert den Export in Chunks von bis zu EXPORT_BATCH_ROWS Zeilen. Die Nachrichten kommen über
+    AsyncSession.stream mit yield_per, der Speicherbedarf hängt also nicht von der Verlaufslänge ab.
+    """
+    yield fastresponse.dumps({"type": "export", "version": EXPORT_VERSION,
+                              "exported_at": datetime.utcnow().isoformat() + "Z"}) + b"\n"
+    async with AsyncSessionLocal() as db:
+        chats = await db.stream(
+            select(models.Chat.id, models.Chat.title, models.Chat.is_pinned)
+            .where(models.Chat.owner_id == owner_id)
+            .order_by(models.Chat.id)
+            .execution_options(yield_per=EXPORT_BATCH_ROWS)
+        )
+        async for partition in chats.partitions():
+            yield b"".join(
+                fastresponse.dumps({"type": "chat", "id": chat_id, "title": title, "is_pinned": is_pinned}) + b"\n"
+                for chat_id, title, is_pinned in partition
+            )
+
+        # Archivierte Nachrichten zuerst: sie sind pro Chat älter als alle in messages, beim Import bleibt
+        # die Reihenfolge innerhalb eines Chats damit erhalten
+        segments = await db.stream(
+            select(models.MessageArchive.chat_id, models.MessageArchive.codec, models.MessageArchive.payload)
+            .join(models.Chat, models.Chat.id == models.MessageArchive.chat_id)
+            .where(models.Chat.owner_id == owner_id)
+            .order_by(models.MessageArchive.chat_id, models.MessageArchive.first_id)
+            .execution_options(yield_per=EXPORT_BATCH_SEGMENTS)
+        )
+        async for partition in segments.partitions():
+            for chat_id, codec, payload in partition:
+                rows = await asyncio.to_thread(archive.decompress_segment, codec, payload)
+                types = {}
+                if embed_images:
+                    types = await db.run_sync(archive.media_types, (row[3] for row in rows))
+                lines = []
+                for _, content, sender, image_hash, inline in rows:
+                    if image_hash and embed_images:
+                        image_data = await asyncio.to_thread(_image_value, image_hash, types.get(image_hash),
+                                                             inline, True)
+                    else:
+                        image_data = _image_value(image_hash, None, inline, False)
+                    lines.append(fastresponse.dumps({"type": "message", "chat_id": chat_id, "content": content,
+                                                     "sender": sender, "image_data": image_data}) + b"\n")
+                yield b"".join(lines)
+
+        messages = await db.stream(
+            select(models.Message.chat_id, models.Message.content, models.Message.sender,
+                   models.Message.image_hash, models.Blob.media_type, models.Message.image_data_inline)
+            .join(models.Chat, models.Chat.id == models.Message.chat_id)
+            .outerjoin(models.Blob, models.Blob.hash == models.Message.image_hash)
+            .where(models.Chat.owner_id == owner_id)
+            .order_by(models.Message.chat_id, models.Message.id)
+            .execution_options(yield_per=EXPORT_BATCH_ROWS)
+        )
+        async for partition in messages.partitions():
+            lines = []
+            for chat_id, content, sender, image_hash, media_type, inline in partition:
+                if image_hash and embed_images:
+                    image_data = await asyncio.to_thread(_image_value, image_hash, media_type, inline, True)
+                else:
+                    image_data = _image_value(image_hash, media_type, inline, False)
+                lines.append(fastresponse.dumps({"type": "message", "chat_id": chat_id, "content": content,
+                                                 "sender": sender, "image_data": image_data}) + b"\n")
+            yield b"".join(lines)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = EXPORT_GZIP_LEVEL) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip-Container
+    async for chunk in chunks:
+        # SYNC_FLUSH, damit der Client jeden Batch sofort bekommt
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# --- Import ---
+def _inflate(decompressor, data: bytes) -> Iterator[bytes]:
+    """
+    Entpackt data in Stücken von höchstens IMPORT_MAX_LINE_BYTES. Ohne max_length würde ein kleiner
+    gzip-Block (gzip-Bombe) in einem Aufruf auf Gigabytes anwachsen, bevor das Zeilenlimit greift.
+    """
+    while True:
+        out = decompressor.decompress(data, IMPORT_MAX_LINE_BYTES)
+        data = decompressor.unconsumed_tail
+        if out:
+            yield out
+        if not data and len(out) < IMPORT_MAX_LINE_BYTES:
+            return
+
+
+async def _ndjson_records(chunks: AsyncIterator[bytes], compressed: bool) -> AsyncIterator[Tuple[int, bytes]]:
+    """Zerlegt den (optional gzip-komprimierten) Body in Zeilen; liefert (Zeilennummer, Zeile)."""
+    decompressor = zlib.decompressobj(47) if compressed else None  # 47: gzip oder zlib automatisch
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in chunks:
+        for piece in _inflate(decompressor, chunk) if decompressor is not None else (chunk,):
+            buffer += piece
+            start = 0
+            while True:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    break
+                line_no += 1
+                yield line_no, bytes(buffer[start:end])
+                start = end + 1
+            del buffer[:start]
+            # Nach jedem Stück prüfen: der Puffer wächst so höchstens auf das Doppelte des Limits
+            if len(buffer) > IMPORT_MAX_LINE_BYTES:
+                raise ChatImportError(f"Line {line_no + 1} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+    if decompressor is not None:
+        buffer += decompressor.flush()
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            raise ChatImportError(f"Line {line_no + 1} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+    if buffer.strip():
+        yield line_no + 1, bytes(buffer)
+
+
+class ChatImporter:
+    """
+    Liest einen Export und legt die Chats für owner_id neu an. Chats werden gesammelt eingefügt, sobald die
+    erste Nachricht sie braucht; Nachrichten in Batches (IMPORT_BATCH_ROWS / IMPORT_BATCH_BYTES), jeweils in einer
+    eigenen kurzen Transaktion, damit die Schreibsperre nicht für die Dauer des Uploads gehalten wird.
+    Schlägt der Import fehl, werden die bereits angelegten Chats wieder entfernt.
+    """
+
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        self._chat_ids: Dict[int, int] = {}
+        self._seen_chats: Set[int] = set()
+        self._pending_chats: List[schemas.ExportChat] = []
+        self._pending_messages: List[Tuple[int, schemas.MessageCreate]] = []
+        self._pending_bytes = 0
+        self.chats = 0
+        self.messages = 0
+
+    async def run(self, chunks: AsyncIterator[bytes], compressed: bool) -> schemas.ImportResult:
+        try:
+            async for line_no, line in _ndjson_records(chunks, compressed):
+                if line.strip():
+                    await self._add_line(line_no, line)
+            await self._flush_chats()
+            await self._flush_messages()
+        except zlib.error as e:
+            await self._rollback()
+            raise ChatImportError(f"Invalid gzip data: {e}")
+        except BaseException:
+            await self._rollback()
+            raise
+        return schemas.ImportResult(chats=self.chats, messages=self.messages)
+
+    async def _add_line(self, line_no: int, line: bytes):
+        try:
+            record = fastresponse.loads(line)
+            kind = record.get("type") if isinstance(record, dict) else None
+            if kind == "chat":
+                chat = schemas.ExportChat.model_validate(record)
+                if chat.id in self._seen_chats:
+                    raise ChatImportError(f"Line {line_no}: duplicate chat id {chat.id}")
+                self._seen_chats.add(chat.id)
+                self._pending_chats.append(chat)
+            elif kind == "message":
+                message = schemas.ExportMessage.model_validate(record)
+                await self._add_message(line_no, message, len(line))
+            elif kind != "export":
+                raise ChatImportError(f"Line {line_no}: unknown record type {kind!r}")
+        except (ValueError, ValidationError) as e:
+            raise ChatImportError(f"Line {line_no}: {e}")
+
+    async def _add_message(self, line_no: int, message: schemas.ExportMessage, size: int):
+        if message.chat_id not in self._chat_ids:
+            await self._flush_chats()
+            if message.chat_id not in self._chat_ids:
+                raise ChatImportError(f"Line {line_no}: message refers to unknown chat {message.chat_id}")
+        self._pending_messages.append((self._chat_ids[message.chat_id], schemas.MessageCreate(
+            content=message.content, sender=message.sender, image_data=message.image_data)))
+        self._pending_bytes += size
+        if len(self._pending_messages) >= IMPORT_BATCH_ROWS or self._pending_bytes >= IMPORT_BATCH_BYTES:
+            await self._flush_messages()
+
+    async def _flush_chats(self):
+        if not self._pending_chats:
+            return
+        chats, self._pending_chats = self._pending_chats, []
+        ai_chat_ids = await self._allocate_ai_chats(len(chats))
+        async with AsyncSessionLocal() as db:
+            new_ids = await db.run_sync(lambda session: crud.insert_chats(session, self.owner_id, chats, ai_chat_ids))
+            await db.commit()
+        for chat, new_id in zip(chats, new_ids):
+            self._chat_ids[chat.id] = new_id
+        self.chats += len(chats)
+
+    async def _allocate_ai_chats(self, count: int) -> List[int]:
+        """Neue AI-Chats für die importierten Chats: zuerst aus dem Pool, der Rest direkt beim AI-Server."""
+        ai_chat_ids: List[int] = []
+        async with AsyncSessionLocal() as db:
+            while len(ai_chat_ids) < count:
+                ai_chat_id = await chatpool.chat_pool.claim(db)
+                if ai_chat_id is None:
+                    break
+                ai_chat_ids.append(ai_chat_id)
+            await db.commit()
+        while len(ai_chat_ids) < count:
+            try:
+                ai_chat_ids.append(await chatpool.create_ai_chat())
+            except ValueError as e:
+                raise ChatImportError(f"Could not create AI chat: {e}")
+        return ai_chat_ids
+
+    async def _flush_messages(self):
+        if not self._pending_messages:
+            return
+        rows, self._pending_messages, self._pending_bytes = self._pending_messages, [], 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(lambda session: crud.insert_message_rows(session, rows))
+                await db.commit()
+        except ValueError as e:
+            # Ungültige Bilddaten oder unbekannte Blob-Referenz
+            raise ChatImportError(f"Invalid image data: {e}")
+        self.messages += len(rows)
+
+    async def _rollback(self):
+        created = list(self._chat_ids.values())
+        if not created:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(lambda session: crud.delete_chats_by_ids(session, created))
+                await db.commit()
+        except Exception as e:
+            print(f"Abgebrochener Import: {len(created)} Chats konnten nicht entfernt werden: {e}")
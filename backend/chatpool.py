@@ -0,0 +1,129 @@
+# backend/chatpool.py
+
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import admission, crud_async, upstream, workers
+from .models import AsyncSessionLocal
+
+# --- Konfiguration ---
+# Anzahl vorab angelegter AI-Chats; 0 schaltet den Pool ab
+CHAT_POOL_SIZE = int(os.getenv("CHAT_POOL_SIZE", "4"))
+# Ältere Einträge werden nicht mehr vergeben (der AI-Server könnte sie inzwischen verworfen haben)
+CHAT_POOL_MAX_AGE = float(os.getenv("CHAT_POOL_MAX_AGE", str(24 * 3600)))
+CHAT_POOL_CHECK_INTERVAL = float(os.getenv("CHAT_POOL_CHECK_INTERVAL", "300"))
+CHAT_POOL_RETRY_SECONDS = float(os.getenv("CHAT_POOL_RETRY_SECONDS", "30"))
+
+
+async def create_ai_chat() -> int:
+    """Legt synchron einen Chat beim AI-Server an und gibt dessen ID zurück."""
+    client = upstream.get_client()
+    with await admission.admit("create_chat"):
+        response = await client.post("/chats/", timeout=upstream.timeout_for("create_chat"))
+        response.raise_for_status()
+    ai_chat_id = response.json().get("id")
+    if not ai_chat_id:
+        raise ValueError("AI server did not return a valid chat ID.")
+    return ai_chat_id
+
+
+class ChatPool:
+    """
+    Hält CHAT_POOL_SIZE vorab angelegte ai_chat_ids in der Tabelle ai_chat_pool bereit.
+    claim() nimmt lokal eine ID heraus und weckt den Hintergrund-Task, der den Pool wieder auffüllt.
+    """
+
+    def __init__(self, target_size: int, max_age: float):
+        self.target_size = target_size
+        self.max_age = max_age
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.refill_errors = 0
+        # Bei mehreren Workern füllt immer nur einer auf, sonst würde jeder den Fehlbestand anlegen
+        self._refill_lock = workers.ProcessLock("chat-pool")
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.max_age)
+
+    async def claim(self, db: AsyncSession) -> Optional[int]:
+        if self.target_size <= 0:
+            return None
+        ai_chat_id = await crud_async.claim_pooled_ai_chat(db, created_after=self._cutoff())
+        if ai_chat_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._wakeup.set()
+        return ai_chat_id
+
+    def start(self):
+        if self.target_size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = CHAT_POOL_CHECK_INTERVAL
+            try:
+                await self._refill()
+            except Exception as e:
+                self.refill_errors += 1
+                delay = CHAT_POOL_RETRY_SECONDS
+                print(f"Chat-Pool konnte nicht aufgefüllt werden: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self):
+        if not self._refill_lock.try_acquire():
+            return
+        try:
+            await self._refill_locked()
+        finally:
+            self._refill_lock.release()
+
+    async def _refill_locked(self):
+        cutoff = self._cutoff()
+        async with AsyncSessionLocal() as db:
+            await crud_async.purge_pooled_ai_chats(db, created_before=cutoff)
+            missing = self.target_size - await crud_async.count_pooled_ai_chats(db, created_after=cutoff)
+            await db.commit()
+        # Einzeln einfügen, damit jede neue ID sofort vergeben werden kann
+        for _ in range(missing):
+            ai_chat_id = await create_ai_chat()
+            async with AsyncSessionLocal() as db:
+                await crud_async.add_pooled_ai_chats(db, [ai_chat_id])
+                await db.commit()
+            self.created += 1
+
+    async def stats(self) -> Dict[str, int]:
+        async with AsyncSessionLocal() as db:
+            available = await crud_async.count_pooled_ai_chats(db, created_after=self._cutoff())
+        return {
+            "target_size": self.target_size,
+            "available": available,
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "refill_errors": self.refill_errors,
+        }
+
+
+chat_pool = ChatPool(CHAT_POOL_SIZE, CHAT_POOL_MAX_AGE)
@@ -1,12 +1,19 @@
 # backend/crud.py
 
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from passlib.context import CryptContext
-from . import models, schemas
+from sqlalchemy import Integer, bindparam, cast, desc, func, insert, select, update
+from . import archive, blobstore, models, schemas
+from .passwords import pwd_context
+from .usercache import user_cache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Länge der Nachrichtenvorschau in der Chat-Liste
+CHAT_PREVIEW_CHARS = 120
 
+# Synchrone Varianten; Endpunkte nutzen den Executor in passwords.py
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -17,8 +24,16 @@ def get_password_hash(password):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def get_user_by_id(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+# Lädt nur die Spalten, die get_current_user braucht
+def get_user_identity(db: Session, username: str):
+    return db.query(models.User.id, models.User.username).filter(models.User.username == username).first()
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.flush()
@@ -29,18 +44,21 @@ def create_user(db: Session, user: schemas.UserCreate):
 def update_user_profile(db: Session, user: models.User, profile_data: schemas.ProfileUpdate):
     user.real_name = profile_data.real_name
     user.birth_date = profile_data.birth_date
-    user.profile_picture = profile_data.profile_picture
+    user.profile_picture_hash = blobstore.store_image_value(db, profile_data.profile_picture)
+    user.profile_picture_inline = None
     db.add(user)
     db.flush()
     db.refresh(user)
+    user_cache.invalidate(user.username)
     return user
 
 # NEU: Funktion zum Ändern des Passworts
-def update_user_password(db: Session, user: models.User, new_password: str):
-    user.hashed_password = get_password_hash(new_password)
+def update_user_password(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
     db.add(user)
     db.flush()
     db.refresh(user)
+    user_cache.invalidate(user.username)
     return user
 
 # --- Chat CRUD ---
@@ -55,9 +73,11 @@ def create_chat_for_user(db: Session, title: str, owner_id: int, ai_chat_id: int
     db.add(db_chat)
     db.flush()
     db.refresh(db_chat)
+    bump_chat_summary(db, owner_id, chats=1)
     return db_chat
 
 def update_chat(db: Session, chat: models.Chat, update_data: schemas.ChatUpdate):
+    was_pinned = chat.is_pinned
     if update_data.title is not None:
         chat.title = update_data.title
     if update_data.is_pinned is not None:
@@ -65,16 +85,273 @@ def update_chat(db: Session, chat: models.Chat, update_data: schemas.ChatUpdate)
     db.add(chat)
     db.flush()
     db.refresh(chat)
+    bump_chat_summary(db, chat.owner_id, pinned=int(chat.is_pinned) - int(was_pinned))
     return chat
 
 def delete_chat(db: Session, chat: models.Chat):
+    owner_id = chat.owner_id
+    archive.delete_archived(db, [chat.id])
     db.delete(chat)
     db.flush()
+    refresh_chat_summary(db, owner_id)
+
+def insert_chats(db: Session, owner_id: int, chats: List[schemas.ExportChat], ai_chat_ids: List[int]) -> List[int]:
+    """
+    Legt mehrere Chats mit einem Statement an und gibt die neuen IDs in Eingabereihenfolge zurück.
+    ai_chat_ids sind frisch angelegte AI-Chats; ein ai_chat_id aus einem Export wird nie übernommen.
+    """
+    result = db.execute(
+        insert(models.Chat).returning(models.Chat.id, sort_by_parameter_order=True),
+        [{"title": c.title, "owner_id": owner_id, "is_pinned": c.is_pinned, "ai_chat_id": ai_chat_id}
+         for c, ai_chat_id in zip(chats, ai_chat_ids)],
+    )
+    chat_ids = list(result.scalars())
+    # Die AI-Chats sind neu und leer: Wasserstand bei 0, spätere Antworten werden nur angehängt
+    db.execute(insert(models.ChatSyncState),
+               [{"chat_id": chat_id, "ai_message_count": 0, "last_message_hash": None, "local_history": True}
+                for chat_id in chat_ids])
+    refresh_chat_summary(db, owner_id)
+    return chat_ids
+
+def delete_chats_by_ids(db: Session, chat_ids: List[int]):
+    owner_ids = db.execute(
+        select(models.Chat.owner_id).where(models.Chat.id.in_(chat_ids)).distinct()
+    ).scalars().all()
+    archive.delete_archived(db, chat_ids)
+    db.query(models.Message).filter(models.Message.chat_id.in_(chat_ids)).delete(synchronize_session=False)
+    db.query(models.ChatSyncState).filter(models.ChatSyncState.chat_id.in_(chat_ids)).delete(synchronize_session=False)
+    db.query(models.Chat).filter(models.Chat.id.in_(chat_ids)).delete(synchronize_session=False)
+    for owner_id in owner_ids:
+        refresh_chat_summary(db, owner_id)
+
+# --- Chat-Übersicht ---
+# Jeder Schreibzugriff auf Chats oder Nachrichten hält chats.message_count/last_* und chat_summaries aktuell
+# und erhöht chat_summaries.version; GET /api/chats braucht dadurch für eine unveränderte Liste nur einen Lookup.
+def refresh_chat_summary(db: Session, owner_id: int) -> models.ChatSummary:
+    """Berechnet die Übersicht aus den Chats neu (nach Löschen/Import und beim ersten Zugriff)."""
+    chat_count, pinned_count, message_count = db.execute(
+        select(func.count(), func.coalesce(func.sum(cast(models.Chat.is_pinned, Integer)), 0),
+               func.coalesce(func.sum(models.Chat.message_count), 0))
+        .where(models.Chat.owner_id == owner_id)
+    ).one()
+    last = db.execute(
+        select(models.Chat.last_message_preview, models.Chat.last_activity_at)
+        .where(models.Chat.owner_id == owner_id, models.Chat.last_activity_at.is_not(None))
+        .order_by(desc(models.Chat.last_activity_at))
+        .limit(1)
+    ).first()
+    summary = db.get(models.ChatSummary, owner_id)
+    if summary is None:
+        summary = models.ChatSummary(owner_id=owner_id, version=0)
+        db.add(summary)
+    summary.version += 1
+    summary.chat_count = chat_count
+    summary.pinned_count = pinned_count
+    summary.message_count = message_count
+    summary.last_message_preview, summary.last_activity_at = last if last else (None, None)
+    db.flush()
+    return summary
+
+def get_chat_summary(db: Session, owner_id: int) -> models.ChatSummary:
+    summary = db.get(models.ChatSummary, owner_id)
+    if summary is None:
+        summary = refresh_chat_summary(db, owner_id)
+    return summary
+
+def bump_chat_summary(db: Session, owner_id: int, chats: int = 0, pinned: int = 0, messages: int = 0,
+                      last_message_preview: Optional[str] = None, last_activity_at: Optional[datetime] = None):
+    """Inkrementelle Änderung per UPDATE (ohne die Zeile zu laden); fehlt sie noch, wird sie neu berechnet."""
+    values = {
+        "version": models.ChatSummary.version + 1,
+        "chat_count": models.ChatSummary.chat_count + chats,
+        "pinned_count": models.ChatSummary.pinned_count + pinned,
+        "message_count": models.ChatSummary.message_count + messages,
+    }
+    if last_activity_at is not None:
+        values["last_message_preview"] = last_message_preview
+        values["last_activity_at"] = last_activity_at
+    result = db.execute(update(models.ChatSummary).where(models.ChatSummary.owner_id == owner_id).values(**values))
+    if result.rowcount == 0:
+        refresh_chat_summary(db, owner_id)
+
+def message_preview(message: schemas.MessageCreate) -> str:
+    return (message.content or "")[:CHAT_PREVIEW_CHARS]
+
+def _update_chat_stats(db: Session, chat_id: int, messages: List[schemas.MessageCreate], reset: bool,
+                       now: datetime) -> Optional[int]:
+    """Pflegt message_count/last_* des Chats und gibt den Besitzer zurück."""
+    return db.execute(
+        update(models.Chat)
+        .where(models.Chat.id == chat_id)
+        .values(message_count=len(messages) if reset else models.Chat.message_count + len(messages),
+                last_message_preview=message_preview(messages[-1]) if messages else None,
+                last_activity_at=now if messages else None)
+        .returning(models.Chat.owner_id)
+    ).scalar()
+
+def note_new_messages(db: Session, chat_id: int, messages: List[schemas.MessageCreate], reset: bool = False):
+    """Aktualisiert Chat und Übersicht nach dem Einfügen; reset=True nach einem kompletten Neuaufbau."""
+    if not messages and not reset:
+        return
+    now = datetime.utcnow()
+    owner_id = _update_chat_stats(db, chat_id, messages, reset, now)
+    if owner_id is None:
+        return
+    if reset:
+        refresh_chat_summary(db, owner_id)
+    else:
+        bump_chat_summary(db, owner_id, messages=len(messages), last_message_preview=message_preview(messages[-1]),
+                          last_activity_at=now)
 
 # --- Message CRUD ---
+def _message_row(db: Session, message: schemas.MessageCreate, chat_id: int) -> dict:
+    return {
+        "content": message.content,
+        "sender": message.sender,
+        "image_hash": blobstore.store_image_value(db, message.image_data),
+        "chat_id": chat_id,
+    }
+
 def create_message(db: Session, message: schemas.MessageCreate, chat_id: int):
-    db_message = models.Message(**message.dict(), chat_id=chat_id)
+    db_message = models.Message(**_message_row(db, message, chat_id))
     db.add(db_message)
     db.flush()
     db.refresh(db_message)
+    note_new_messages(db, chat_id, [message])
     return db_message
+
+def get_messages_page(db: Session, chat_id: int, before_id: Optional[int], limit: int, with_image_data: bool):
+    """Keyset-Pagination über Message.id, neueste zuerst. Liefert bis zu limit + 1 Zeilen (für has_more)."""
+    columns = [
+        models.Message.id,
+        models.Message.chat_id,
+        models.Message.content,
+        models.Message.sender,
+        models.Message.image_hash,
+    ]
+    if with_image_data:
+        columns.append(models.Blob.media_type)
+    query = db.query(*columns)
+    if with_image_data:
+        query = query.outerjoin(models.Blob, models.Blob.hash == models.Message.image_hash)
+    query = query.filter(models.Message.chat_id == chat_id)
+    if before_id is not None:
+        query = query.filter(models.Message.id < before_id)
+    rows = query.order_by(desc(models.Message.id)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        # Ältere Seiten liegen ggf. im Archiv (dort sind alle IDs kleiner als in messages)
+        oldest = rows[-1].id if rows else before_id
+        archived = archive.load_archived(db, chat_id, before_id=oldest, limit=limit + 1 - len(rows),
+                                         with_media_type=with_image_data)
+        rows.extend(reversed(archived))
+    return rows
+
+def insert_messages(db: Session, messages: List[schemas.MessageCreate], chat_id: int) -> List[int]:
+    """Fügt mehrere Nachrichten mit einem Statement ein und gibt ihre IDs in Eingabereihenfolge zurück."""
+    result = db.execute(
+        insert(models.Message).returning(models.Message.id, sort_by_parameter_order=True),
+        [_message_row(db, m, chat_id) for m in messages],
+    )
+    message_ids = list(result.scalars())
+    note_new_messages(db, chat_id, messages)
+    return message_ids
+
+def insert_message_rows(db: Session, rows: List[Tuple[int, schemas.MessageCreate]]):
+    """Bulk-Insert über mehrere Chats hinweg; rows = (chat_id, Nachricht)."""
+    if not rows:
+        return
+    db.execute(models.Message.__table__.insert(), [_message_row(db, m, chat_id) for chat_id, m in rows])
+    by_chat: Dict[int, List[schemas.MessageCreate]] = {}
+    for chat_id, message in rows:
+        by_chat.setdefault(chat_id, []).append(message)
+    # Alle Chats des Batches in einem executemany, die Übersicht einmal pro Besitzer
+    now = datetime.utcnow()
+    chats = models.Chat.__table__
+    db.execute(
+        update(chats)
+        .where(chats.c.id == bindparam("b_chat_id"))
+        .values(message_count=chats.c.message_count + bindparam("b_added"),
+                last_message_preview=bindparam("b_preview"), last_activity_at=now),
+        [{"b_chat_id": chat_id, "b_added": len(messages), "b_preview": message_preview(messages[-1])}
+         for chat_id, messages in by_chat.items()],
+    )
+    added: Dict[int, int] = {}
+    for chat_id, owner_id in db.execute(
+        select(models.Chat.id, models.Chat.owner_id).where(models.Chat.id.in_(list(by_chat)))
+    ):
+        added[owner_id] = added.get(owner_id, 0) + len(by_chat[chat_id])
+    last_preview = message_preview(rows[-1][1])
+    for owner_id, count in added.items():
+        bump_chat_summary(db, owner_id, messages=count, last_message_preview=last_preview, last_activity_at=now)
+
+def bulk_create_messages(db: Session, messages: List[schemas.MessageCreate], chat_id: int, reset: bool = False):
+    if messages:
+        db.execute(models.Message.__table__.insert(), [_message_row(db, m, chat_id) for m in messages])
+    note_new_messages(db, chat_id, messages, reset=reset)
+
+# --- Sync mit dem AI-Server ---
+def message_from_ai(msg: dict) -> schemas.MessageCreate:
+    sender = "user" if msg.get("role") == "user" else "coldBot"
+    # Annahme, dass der AI-Server image_base64 bereitstellt
+    return schemas.MessageCreate(sender=sender, content=msg.get("content"), image_data=msg.get("image_base64"))
+
+def message_fingerprint(message: schemas.MessageCreate) -> str:
+    return hashlib.sha1(f"{message.sender}\x00{message.content}".encode("utf-8")).hexdigest()
+
+def get_chat_with_sync_state(db: Session, chat_id: int, owner_id: int):
+    return (
+        db.query(models.Chat, models.ChatSyncState)
+        .outerjoin(models.ChatSyncState, models.ChatSyncState.chat_id == models.Chat.id)
+        .filter(models.Chat.id == chat_id, models.Chat.owner_id == owner_id)
+        .first()
+    )
+
+def _set_sync_state(db: Session, chat_id: int, state: Optional[models.ChatSyncState],
+                    messages: List[schemas.MessageCreate]):
+    if state is None:
+        state = models.ChatSyncState(chat_id=chat_id)
+        db.add(state)
+    state.ai_message_count = len(messages)
+    state.last_message_hash = message_fingerprint(messages[-1]) if messages else None
+    db.flush()
+
+def _sync_state_matches(state: Optional[models.ChatSyncState], messages: List[schemas.MessageCreate]) -> bool:
+    if state is None or state.ai_message_count > len(messages):
+        return False
+    if state.ai_message_count == 0:
+        return True
+    return message_fingerprint(messages[state.ai_message_count - 1]) == state.last_message_hash
+
+def sync_chat_messages(db: Session, chat_id: int, state: Optional[models.ChatSyncState],
+                       ai_messages: List[schemas.MessageCreate], full: bool = False) -> int:
+    """
+    Spiegelt den Verlauf des AI-Servers in die messages-Tabelle und gibt die Anzahl eingefügter Zeilen zurück.
+    Passt der gespeicherte Wasserstand zum Verlauf, werden nur neue Nachrichten angehängt,
+    sonst wird der Chat komplett neu aufgebaut. Importierte Verläufe gibt es nur lokal: dort wird nie neu
+    aufgebaut, sondern nur der Wasserstand an den Verlauf des AI-Servers angepasst.
+    """
+    rebuild = full or not _sync_state_matches(state, ai_messages)
+    if rebuild and state is not None and state.local_history:
+        _set_sync_state(db, chat_id, state, ai_messages)
+        return 0
+    if not rebuild:
+        new_messages = ai_messages[state.ai_message_count:]
+        if not new_messages:
+            return 0
+    else:
+        archive.delete_archived(db, [chat_id])
+        db.query(models.Message).filter(models.Message.chat_id == chat_id).delete(synchronize_session=False)
+        new_messages = ai_messages
+    bulk_create_messages(db, new_messages, chat_id, reset=rebuild)
+    _set_sync_state(db, chat_id, state, ai_messages)
+    return len(new_messages)
+
+def advance_sync_state(db: Session, chat_id: int, added: int, last_message: schemas.MessageCreate):
+    """Schiebt den Wasserstand nach, wenn ein Austausch bereits lokal gespeichert wurde."""
+    state = db.get(models.ChatSyncState, chat_id)
+    if state is None:
+        # Noch nie synchronisiert: der nächste Sync baut den Chat ohnehin komplett auf.
+        return
+    state.ai_message_count += added
+    state.last_message_hash = message_fingerprint(last_message)
+    db.flush()
@@ -0,0 +1,201 @@
+# backend/crud_async.py
+
+# Async-Varianten der crud-Funktionen für AsyncSession (aiosqlite).
+# Einfache Lesezugriffe sind native Statements; zusammengesetzte Schreibpfade
+# laufen über AsyncSession.run_sync und nutzen die Logik aus crud.py weiter.
+
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete, desc, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import archive, blobstore, crud, models, schemas
+
+# --- User ---
+async def get_user_identity(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(models.User.id, models.User.username).where(models.User.username == username)
+    )
+    return result.first()
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await db.get(models.User, user_id)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str) -> models.User:
+    db_user = await db.run_sync(lambda session: crud.create_user(session, user, hashed_password))
+    # schemas.User enthält die Chats; Lazy-Loading ist bei AsyncSession nicht möglich
+    await db.refresh(db_user, attribute_names=["chats"])
+    return db_user
+
+async def update_user_profile(db: AsyncSession, user: models.User, profile_data: schemas.ProfileUpdate) -> models.User:
+    return await db.run_sync(lambda session: crud.update_user_profile(session, user, profile_data))
+
+async def update_user_password(db: AsyncSession, user: models.User, hashed_password: str) -> models.User:
+    return await db.run_sync(lambda session: crud.update_user_password(session, user, hashed_password))
+
+# --- Chat ---
+async def get_chats_by_owner(db: AsyncSession, owner_id: int) -> List[models.Chat]:
+    result = await db.execute(
+        select(models.Chat)
+        .where(models.Chat.owner_id == owner_id)
+        .order_by(desc(models.Chat.is_pinned), desc(models.Chat.id))
+    )
+    return result.scalars().all()
+
+async def get_chat_by_id(db: AsyncSession, chat_id: int, owner_id: int) -> Optional[models.Chat]:
+    result = await db.execute(
+        select(models.Chat).where(models.Chat.id == chat_id, models.Chat.owner_id == owner_id)
+    )
+    return result.scalars().first()
+
+async def get_chat_with_messages(db: AsyncSession, chat_id: int, owner_id: int) -> Optional[models.Chat]:
+    result = await db.execute(
+        select(models.Chat)
+        .options(selectinload(models.Chat.messages))
+        .where(models.Chat.id == chat_id, models.Chat.owner_id == owner_id)
+    )
+    return result.scalars().first()
+
+# Schneller Lesepfad (siehe fastresponse.py): nur die benötigten Spalten als Tupel, ohne ORM-Objekte und
+# Pydantic. Die Schlüssel entsprechen schemas.ChatInfo bzw. schemas.Chat, damit die Antwort gleich bleibt.
+async def get_chat_list_payload(db: AsyncSession, owner_id: int) -> List[dict]:
+    result = await db.execute(
+        select(models.Chat.id, models.Chat.title, models.Chat.is_pinned, models.Chat.ai_chat_id,
+               models.Chat.message_count, models.Chat.last_message_preview, models.Chat.last_activity_at)
+        .where(models.Chat.owner_id == owner_id)
+        .order_by(desc(models.Chat.is_pinned), desc(models.Chat.id))
+    )
+    return [
+        {"id": chat_id, "title": title, "is_pinned": is_pinned, "ai_chat_id": ai_chat_id,
+         "message_count": message_count, "last_message_preview": preview,
+         "last_activity_at": last_activity_at.isoformat() if last_activity_at else None}
+        for chat_id, title, is_pinned, ai_chat_id, message_count, preview, last_activity_at in result.all()
+    ]
+
+async def get_chat_summary(db: AsyncSession, owner_id: int) -> models.ChatSummary:
+    summary = await db.get(models.ChatSummary, owner_id)
+    if summary is None:
+        summary = await db.run_sync(crud.get_chat_summary, owner_id)
+    return summary
+
+async def get_chat_history_payload(db: AsyncSession, chat_id: int, owner_id: int) -> Optional[dict]:
+    result = await db.execute(
+        select(models.Chat.title, models.Chat.is_pinned, models.Chat.ai_chat_id)
+        .where(models.Chat.id == chat_id, models.Chat.owner_id == owner_id)
+    )
+    chat = result.first()
+    if chat is None:
+        return None
+    # Archivierte Segmente enthalten den ältesten Teil des Verlaufs und kommen daher zuerst
+    archived = await db.run_sync(archive.load_archived, chat_id)
+    result = await db.execute(
+        select(models.Message.id, models.Message.content, models.Message.sender,
+               models.Message.image_hash, models.Message.image_data_inline)
+        .where(models.Message.chat_id == chat_id)
+        .order_by(models.Message.id)
+    )
+    rows = [(m.id, m.content, m.sender, m.image_hash, m.image_inline) for m in archived]
+    rows.extend(result.all())
+    messages = [
+        {
+            "content": content,
+            "sender": sender,
+            # wie models.Message.image_data: Blob-URL, sonst Altdaten
+            "image_data": f"{models.BLOB_URL_PREFIX}{image_hash}" if image_hash else image_inline,
+            "id": message_id,
+            "chat_id": chat_id,
+        }
+        for message_id, content, sender, image_hash, image_inline in rows
+    ]
+    return {"title": chat.title, "id": chat_id, "owner_id": owner_id, "is_pinned": chat.is_pinned,
+            "ai_chat_id": chat.ai_chat_id, "messages": messages}
+
+async def get_chat_with_sync_state(db: AsyncSession, chat_id: int, owner_id: int):
+    return await db.run_sync(crud.get_chat_with_sync_state, chat_id, owner_id)
+
+async def get_sync_state(db: AsyncSession, chat_id: int) -> Optional[models.ChatSyncState]:
+    return await db.get(models.ChatSyncState, chat_id)
+
+async def create_chat_for_user(db: AsyncSession, title: str, owner_id: int, ai_chat_id: int) -> models.Chat:
+    return await db.run_sync(crud.create_chat_for_user, title, owner_id, ai_chat_id)
+
+async def update_chat(db: AsyncSession, chat: models.Chat, update_data: schemas.ChatUpdate) -> models.Chat:
+    return await db.run_sync(lambda session: crud.update_chat(session, chat, update_data))
+
+async def delete_chat(db: AsyncSession, chat: models.Chat):
+    # Die ORM-Kaskade lädt messages/sync_state nach, das geht nur im run_sync-Kontext.
+    await db.run_sync(lambda session: crud.delete_chat(session, chat))
+
+# --- Message ---
+async def create_message(db: AsyncSession, message: schemas.MessageCreate, chat_id: int) -> models.Message:
+    return await db.run_sync(lambda session: crud.create_message(session, message, chat_id))
+
+async def get_messages_page(db: AsyncSession, chat_id: int, before_id: Optional[int], limit: int,
+                            with_image_data: bool):
+    return await db.run_sync(
+        lambda session: crud.get_messages_page(session, chat_id, before_id, limit, with_image_data)
+    )
+
+async def sync_chat_messages(db: AsyncSession, chat_id: int, state: Optional[models.ChatSyncState],
+                             ai_messages: List[schemas.MessageCreate], full: bool = False) -> int:
+    return await db.run_sync(lambda session: crud.sync_chat_messages(session, chat_id, state, ai_messages, full))
+
+async def advance_sync_state(db: AsyncSession, chat_id: int, added: int, last_message: schemas.MessageCreate):
+    await db.run_sync(lambda session: crud.advance_sync_state(session, chat_id, added, last_message))
+
+# --- Blobs ---
+async def get_blob(db: AsyncSession, blob_hash: str) -> Optional[models.Blob]:
+    if not blobstore.is_valid_hash(blob_hash):
+        return None
+    return await db.get(models.Blob, blob_hash)
+
+async def store_image_value(db: AsyncSession, value: Optional[str]) -> Optional[str]:
+    return await db.run_sync(lambda session: blobstore.store_image_value(session, value))
+
+# --- Bildbeschreibungen ---
+async def get_image_description(db: AsyncSession, image_hash: str) -> Optional[str]:
+    result = await db.execute(
+        select(models.ImageDescription.response_json).where(models.ImageDescription.hash == image_hash)
+    )
+    return result.scalar()
+
+async def save_image_description(db: AsyncSession, image_hash: str, response_json: str):
+    await db.merge(models.ImageDescription(hash=image_hash, response_json=response_json))
+    await db.flush()
+
+# --- Chat-Pool ---
+async def claim_pooled_ai_chat(db: AsyncSession, created_after: datetime) -> Optional[int]:
+    # Ein einzelnes DELETE ... RETURNING: zwei gleichzeitige Claims können nie dieselbe ID bekommen
+    oldest = (
+        select(models.PooledAIChat.ai_chat_id)
+        .where(models.PooledAIChat.created_at > created_after)
+        .order_by(models.PooledAIChat.ai_chat_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        delete(models.PooledAIChat)
+        .where(models.PooledAIChat.ai_chat_id == oldest)
+        .returning(models.PooledAIChat.ai_chat_id)
+    )
+    return result.scalar()
+
+async def count_pooled_ai_chats(db: AsyncSession, created_after: datetime) -> int:
+    result = await db.execute(
+        select(func.count()).select_from(models.PooledAIChat).where(models.PooledAIChat.created_at > created_after)
+    )
+    return result.scalar_one()
+
+async def add_pooled_ai_chats(db: AsyncSession, ai_chat_ids: List[int]):
+    now = datetime.utcnow()
+    await db.execute(insert(models.PooledAIChat), [{"ai_chat_id": i, "created_at": now} for i in ai_chat_ids])
+
+async def purge_pooled_ai_chats(db: AsyncSession, created_before: datetime) -> int:
+    result = await db.execute(delete(models.PooledAIChat).where(models.PooledAIChat.created_at <= created_before))
+    return result.rowcount
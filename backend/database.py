@@ -1,20 +1,90 @@
 # backend/database.py
 
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# URL für die SQLite-Datenbank. Die Datei wird im selben Verzeichnis erstellt.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./coldnet.db"
+# Pfad zur SQLite-Datenbank (relativ zum Arbeitsverzeichnis).
+DATABASE_PATH = os.getenv("COLDNET_DB_PATH", "./coldnet.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# --- SQLite-Performance-Profil ---
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "300"))  # Sekunden
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Verbindungen pro Prozess und Engine; bei mehreren Workern entsprechend mal der Anzahl Worker
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_POOL_OVERFLOW = int(os.getenv("SQLITE_POOL_OVERFLOW", "10"))
 
-# Die Engine ist der zentrale Zugangspunkt zur Datenbank.
-# connect_args ist nur für SQLite notwendig, um Thread-Sicherheit zu gewährleisten.
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLITE_PRAGMAS = (
+    # Muss vor dem Anlegen der ersten Tabelle gesetzt sein; bestehende Dateien stellt archive.py per VACUUM um
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", str(int(SQLITE_BUSY_TIMEOUT * 1000))),
+    ("cache_size", str(-SQLITE_CACHE_SIZE_KB)),  # negativ = KiB statt Seiten
+    ("mmap_size", str(SQLITE_MMAP_SIZE)),
+    ("temp_store", "MEMORY"),
 )
 
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL) -> Engine:
+    # check_same_thread=False: die Verbindung wird im Threadpool von FastAPI genutzt
+    sync_engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+                                pool_size=SQLITE_POOL_SIZE, max_overflow=SQLITE_POOL_OVERFLOW)
+    event.listen(sync_engine, "connect", _apply_pragmas)
+    return sync_engine
+
+
+def make_async_engine(url: str = ASYNC_SQLALCHEMY_DATABASE_URL) -> AsyncEngine:
+    new_engine = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT},
+                                     pool_size=SQLITE_POOL_SIZE, max_overflow=SQLITE_POOL_OVERFLOW)
+    event.listen(new_engine.sync_engine, "connect", _apply_pragmas)
+    return new_engine
+
+
+# Die Engines sind der zentrale Zugangspunkt zur Datenbank.
+engine = make_engine()
+async_engine = make_async_engine()
+
+_engine_pid = os.getpid()
+
+
+async def init_process_engines():
+    """
+    Pro Worker-Prozess aus dem lifespan aufgerufen. Wurde der Prozess geforkt (z.B. gunicorn --preload),
+    werden die geerbten Verbindungen verworfen, ohne sie zu schließen (sie gehören dem Elternprozess).
+    Danach je Engine eine Verbindung öffnen, damit die PRAGMAs vor dem ersten Request gesetzt sind.
+    """
+    global _engine_pid
+    if os.getpid() != _engine_pid:
+        engine.dispose(close=False)
+        async_engine.sync_engine.dispose(close=False)
+        _engine_pid = os.getpid()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    async with async_engine.connect() as conn:
+        await conn.exec_driver_sql("SELECT 1")
+
+
 # Jede Instanz von SessionLocal wird eine Datenbanksitzung sein.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: Objekte bleiben nach dem Commit für die Serialisierung lesbar
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Base wird als Basisklasse für unsere ORM-Modelle verwendet.
 Base = declarative_base()
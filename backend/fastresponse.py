@@ -0,0 +1,102 @@
+# backend/fastresponse.py
+
+import os
+import gzip
+import json
+import asyncio
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson ist optional; ohne wird das json-Modul der Standardbibliothek verwendet
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli ist optional; ohne wird nur gzip angeboten
+    brotli = None
+
+# --- Konfiguration ---
+# Kleinere Antworten gehen unkomprimiert raus (Kompression lohnt sich dort weder für CPU noch Bandbreite)
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+# Ab dieser Größe wird in einem Thread komprimiert, damit der Event-Loop frei bleibt
+RESPONSE_COMPRESS_THREAD_BYTES = int(os.getenv("RESPONSE_COMPRESS_THREAD_BYTES", str(256 * 1024)))
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Wählt anhand von Accept-Encoding br oder gzip (bei gleichem q bevorzugt br); None = unkomprimiert."""
+    offered: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        offered[name] = q
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON-Antwort über orjson, ohne Pydantic-Validierung. Für Endpunkte, die Zeilen direkt als dict/list liefern;
+    compress_for() komprimiert den Body danach passend zum Accept-Encoding des Clients.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+    async def compress_for(self, request: Request) -> "FastJSONResponse":
+        self.headers["Vary"] = "Accept-Encoding"
+        if len(self.body) < RESPONSE_COMPRESS_MIN_BYTES:
+            return self
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is None:
+            return self
+        if len(self.body) >= RESPONSE_COMPRESS_THREAD_BYTES:
+            self.body = await asyncio.to_thread(compress, self.body, encoding)
+        else:
+            self.body = compress(self.body, encoding)
+        self.headers["Content-Encoding"] = encoding
+        self.headers["Content-Length"] = str(len(self.body))
+        return self
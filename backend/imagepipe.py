@@ -0,0 +1,118 @@
+# backend/imagepipe.py
+
+import io
+import os
+import asyncio
+import hashlib
+from typing import AsyncIterator, Optional, Tuple
+from contextlib import aclosing
+
+from fastapi import Request, UploadFile
+from starlette.datastructures import UploadFile as FormFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow ist optional; ohne wird das Original weitergereicht
+    Image = None
+    ImageOps = None
+
+# --- Konfiguration ---
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Längste Kante, auf die Fotos vor dem Senden an das Modell verkleinert werden
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+CHUNK_SIZE = 64 * 1024
+# Spielraum für Multipart-Grenzen, Part-Header und das Dateinamen-Feld über der eigentlichen Bildgröße
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+async def read_upload_limited(upload: UploadFile, limit: int = IMAGE_MAX_UPLOAD_BYTES) -> bytes:
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > limit:
+            raise ImageTooLarge(f"Image exceeds {limit} bytes")
+
+
+async def _limited_stream(request: Request, limit: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise ImageTooLarge(f"Request body exceeds {limit} bytes")
+        yield chunk
+
+
+async def read_image_form(request: Request, field: str = "image_file",
+                          limit: int = IMAGE_MAX_UPLOAD_BYTES) -> Tuple[bytes, Optional[str], Optional[str]]:
+    """
+    Liest das Bild aus einem multipart/form-data-Body. Gibt (bytes, filename, content_type) zurück.
+    Mit File(...) würde Starlette den ganzen Body vor dem Endpoint auf Platte puffern; hier wird nach
+    Content-Length abgelehnt und der Stream (auch chunked) beim Überschreiten des Limits abgebrochen.
+    """
+    body_limit = limit + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > body_limit:
+        raise ImageTooLarge(f"Request body exceeds {body_limit} bytes")
+    if not request.headers.get("content-type", "").lower().startswith("multipart/form-data"):
+        raise InvalidUpload("Expected multipart/form-data")
+
+    try:
+        async with aclosing(_limited_stream(request, body_limit)) as stream:
+            form = await MultiPartParser(request.headers, stream, max_files=1, max_fields=10).parse()
+    except MultiPartException as e:
+        raise InvalidUpload(e.message)
+    try:
+        upload = form.get(field)
+        if not isinstance(upload, FormFile):
+            raise InvalidUpload(f"Missing file field '{field}'")
+        data = await read_upload_limited(upload, limit)
+        return data, upload.filename, upload.content_type
+    finally:
+        await form.close()
+
+
+def content_hash(data: bytes) -> str:
+    # Die Pipeline-Parameter gehören zum Key, sonst würden alte Beschreibungen nach einer Änderung weiterverwendet
+    digest = hashlib.sha256(data)
+    digest.update(f"|{IMAGE_MAX_DIMENSION}|{IMAGE_JPEG_QUALITY}".encode())
+    return digest.hexdigest()
+
+
+def prepare_image(data: bytes, filename: Optional[str], content_type: Optional[str]) -> Tuple[bytes, str, str]:
+    """Verkleinert und re-encodiert das Bild als JPEG. Gibt (bytes, filename, content_type) zurück."""
+    original = (data, filename or "image", content_type or "application/octet-stream")
+    if Image is None:
+        return original
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except Exception:
+        # Unbekanntes Format: der AI-Server bekommt das Original und entscheidet selbst
+        return original
+    encoded = out.getvalue()
+    if len(encoded) >= len(data):
+        return original
+    stem = os.path.splitext(filename or "image")[0]
+    return encoded, f"{stem}.jpg", "image/jpeg"
+
+
+async def prepare_image_async(data: bytes, filename: Optional[str], content_type: Optional[str]) -> Tuple[bytes, str, str]:
+    return await asyncio.to_thread(prepare_image, data, filename, content_type)
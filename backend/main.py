@@ -1,32 +1,56 @@
 import os
+import json
+import asyncio
 import httpx
-import tempfile
-import subprocess
-from typing import List, Optional, AsyncGenerator
-from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, AsyncGenerator, Sequence
+from contextlib import aclosing, asynccontextmanager
 
-from fastapi import Depends, FastAPI, HTTPException, status, File, UploadFile, Response, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import (Depends, FastAPI, HTTPException, status, File, UploadFile, Response, Request, Query, WebSocket,
+                     WebSocketDisconnect)
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 # Annahme, dass diese Module in deinem Projekt existieren
-from .models import Base, engine
-from . import auth, crud, models, schemas
+from .models import AsyncSessionLocal, Base, async_engine, engine
+from .sse import SSE_HEADERS, sse_event
+from . import (admission, archive, audio, audioframes, auth, blobstore, chatexport, chatpool, crud, crud_async,
+               database, fastresponse, imagepipe, messagewriter, metrics, migrations, models, passwords, schemas,
+               search, ttscache, upstream, workers)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Anwendung startet... Erstelle Datenbanktabellen.")
-    Base.metadata.create_all(bind=engine)
+    if workers.SCHEMA_READY:
+        # serve.py hat Tabellen und Migrationen einmal vor dem Start der Worker angelegt
+        print(f"Worker {os.getpid()} startet.")
+    else:
+        print("Anwendung startet... Erstelle Datenbanktabellen.")
+        Base.metadata.create_all(bind=engine)
+        migrations.run_migrations(engine)
+    await database.init_process_engines()
+    await asyncio.to_thread(ttscache.tts_cache.load)
+    await upstream.start_client()
+    chatpool.chat_pool.start()
+    messagewriter.message_writer.start()
+    archive.archiver.start()
     yield
+    await archive.archiver.stop()
+    await chatpool.chat_pool.stop()
+    await messagewriter.message_writer.stop()
+    await upstream.close_client()
+    passwords.shutdown()
+    await async_engine.dispose()
     print("Anwendung wird heruntergefahren.")
 
 
 app = FastAPI(lifespan=lifespan)
-AI_SERVER_URL = "http://127.0.0.1:8000" 
+
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +60,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(passwords.PasswordServiceBusy)
+async def password_service_busy_handler(request: Request, exc: passwords.PasswordServiceBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent password operations, please retry."},
+        headers={"Retry-After": str(passwords.PASSWORD_RETRY_AFTER)},
+    )
+
+
+@app.exception_handler(admission.UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: admission.UpstreamUnavailable):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"AI service is overloaded or unavailable: {exc.reason}"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 INDEX_PATH = os.path.join(PROJECT_ROOT, "index.html")
 
@@ -57,270 +105,794 @@ class TTSPayload(BaseModel):
     text: str
 
 
-# --- HELPER FUNCTION FOR AUDIO NORMALIZATION ---
-def ffmpeg_normalize_to_wav(src_path: str, dst_path: str):
-    cmd = [ "ffmpeg", "-y", "-i", src_path, "-af", "dynaudnorm=f=150:g=15,volume=3dB", "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", dst_path ]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
 
 # --- STT ENDPOINT ---
+async def _transcribe(source, timings: audio.StageTimer, input_args: Sequence[str] = ()) -> dict:
+    """Normalisiert die Aufnahme mit ffmpeg und streamt das WAV direkt zum STT des AI-Servers."""
+    boundary = audio.new_multipart_boundary()
+    async with audio.normalized_wav_stream(source, timings, input_args) as wav_chunks:
+        body = audio.multipart_file_stream("file", "audio.wav", "audio/wav", wav_chunks, boundary)
+        client = upstream.get_client()
+        with await admission.admit("stt"), timings.stage("upstream"):
+            response = await client.post(
+                "/stt/transcribe",
+                content=body,
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+                timeout=upstream.timeout_for("stt"),
+            )
+            response.raise_for_status()
+    return response.json()
+
+
 @app.post("/api/stt/transcribe", tags=["AI & Chat"])
 async def proxy_stt(
         file: UploadFile = File(...),
-        current_user: models.User = Depends(auth.get_current_user)
+        current_user: auth.CurrentUser = Depends(auth.get_current_user)
 ):
-    src_path = None
-    dst_path = None
+    timings = audio.StageTimer()
     try:
-        suffix = os.path.splitext(file.filename or ".tmp")[1].lower()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as src_tmp:
-            src_bytes = await file.read()
-            src_tmp.write(src_bytes)
-            src_path = src_tmp.name
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Upload konnte nicht gespeichert werden: {e}")
-
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as dst_tmp:
-            dst_path = dst_tmp.name
-        try:
-            ffmpeg_normalize_to_wav(src_path, dst_path)
-        except subprocess.CalledProcessError:
-            simple_cmd = [ "ffmpeg", "-y", "-i", src_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", dst_path ]
-            subprocess.run(simple_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    except Exception as e:
-        if src_path and os.path.exists(src_path): os.remove(src_path)
-        raise HTTPException(status_code=500, detail=f"Audio-Vorverarbeitung fehlgeschlagen: {e}")
-
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            with open(dst_path, "rb") as f:
-                files = {'file': ('audio.wav', f, 'audio/wav')}
-                response = await client.post(f"{AI_SERVER_URL}/stt/transcribe", files=files)
-                response.raise_for_status()
-                return response.json()
+        result = await _transcribe(file, timings)
+        return JSONResponse(result, headers={"Server-Timing": timings.server_timing()})
     except httpx.RequestError as exc:
         raise HTTPException(status_code=503, detail=f"AI-Dienst für STT nicht erreichbar: {exc}")
-    finally:
-        if src_path and os.path.exists(src_path): os.remove(src_path)
-        if dst_path and os.path.exists(dst_path): os.remove(dst_path)
+    except (audio.FfmpegError, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Audio-Vorverarbeitung fehlgeschlagen: {e}")
 
 
 @app.post("/api/tts/synthesize", tags=["AI & Chat"])
 async def proxy_tts(
         payload: TTSPayload,
-        current_user: models.User = Depends(auth.get_current_user)
+        current_user: auth.CurrentUser = Depends(auth.get_current_user)
 ):
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(f"{AI_SERVER_URL}/tts/synthesize", json={"text": payload.text})
+    upstream_payload = {"text": payload.text}
+    key = ttscache.cache_key(upstream_payload)
+    cache_status = "HIT"
+
+    async def synthesize():
+        nonlocal cache_status
+        cache_status = "MISS"
+        client = upstream.get_client()
+        with await admission.admit("tts"):
+            response = await client.post("/tts/synthesize", json=upstream_payload, timeout=upstream.timeout_for("tts"))
             response.raise_for_status()
-            return StreamingResponse(response.iter_bytes(), media_type=response.headers.get("content-type"))
+        return response.content, response.headers.get("content-type", "audio/wav")
+
+    try:
+        data, media_type = await ttscache.tts_cache.get_or_create(key, synthesize)
     except httpx.RequestError as exc:
         raise HTTPException(status_code=503, detail=f"AI service for TTS is unavailable: {exc}")
+    return Response(content=data, media_type=media_type, headers={"X-TTS-Cache": cache_status})
 
 
-@app.post("/api/describe-image/", tags=["AI & Chat"])
-async def describe_image(image_file: UploadFile = File(...),
-                         current_user: models.User = Depends(auth.get_current_user)):
+@app.get("/api/stats/upstream", tags=["AI & Chat"])
+async def read_upstream_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return admission.stats()
+
+
+@app.get("/api/stats/chat-pool", tags=["AI & Chat"])
+async def read_chat_pool_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return await chatpool.chat_pool.stats()
+
+
+@app.get("/api/stats/message-writer", tags=["AI & Chat"])
+async def read_message_writer_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return messagewriter.message_writer.stats()
+
+
+@app.get("/api/stats/archive", tags=["AI & Chat"])
+async def read_archive_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return await archive.archiver.stats()
+
+
+@app.get("/api/stats/tts-cache", tags=["AI & Chat"])
+async def read_tts_cache_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return ttscache.tts_cache.stats()
+
+
+# Der Body wird im Endpoint gelesen (siehe imagepipe.read_image_form), damit das Größenlimit greift, bevor
+# der Upload gepuffert ist; das Formular steht deshalb nur in openapi_extra.
+_DESCRIBE_IMAGE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["image_file"],
+            "properties": {"image_file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+
+@app.post("/api/describe-image/", tags=["AI & Chat"], openapi_extra=_DESCRIBE_IMAGE_BODY)
+async def describe_image(request: Request,
+                         current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                         db: AsyncSession = Depends(auth.get_async_db, scope="function")):
     try:
-        files = {'file': (image_file.filename, await image_file.read(), image_file.content_type)}
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(f"{AI_SERVER_URL}/describe-image/", files=files)
+        data, filename, content_type = await imagepipe.read_image_form(request)
+    except imagepipe.ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except imagepipe.InvalidUpload as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+
+    image_hash = imagepipe.content_hash(data)
+    cached = await crud_async.get_image_description(db, image_hash)
+    if cached is not None:
+        return JSONResponse(json.loads(cached), headers={"X-Description-Cache": "HIT"})
+
+    try:
+        content, filename, content_type = await imagepipe.prepare_image_async(data, filename, content_type)
+        files = {'file': (filename, content, content_type)}
+        client = upstream.get_client()
+        with await admission.admit("describe_image"):
+            response = await client.post("/describe-image/", files=files, timeout=upstream.timeout_for("describe_image"))
             response.raise_for_status()
-            return response.json()
+        result = response.json()
     except httpx.RequestError as exc:
         raise HTTPException(status_code=503, detail=f"AI service unavailable: {exc}")
+    await crud_async.save_image_description(db, image_hash, json.dumps(result))
+    return JSONResponse(result, headers={"X-Description-Cache": "MISS"})
+
+
+# --- BLOB STORE ---
+# Blobs sind inhaltsadressiert: die URL enthält den SHA-256 und ändert sich nie, daher "immutable".
+# Die URLs landen in <img src>, ein Bearer-Token wird dort nicht mitgeschickt; geschützt sind die Bilder nur
+# durch den nicht erratbaren Hash. "private" hält sie deshalb aus geteilten Caches (Proxies, CDNs) heraus.
+# nosniff, CSP und Content-Disposition verhindern, dass ein Blob im App-Origin als Dokument ausgeführt wird.
+@app.get("/api/blobs/{blob_hash}", tags=["Blobs"])
+async def read_blob(blob_hash: str, request: Request,
+                    db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    blob = await crud_async.get_blob(db, blob_hash)
+    path = blobstore.blob_path(blob.hash) if blob is not None else None
+    if path is None or not await asyncio.to_thread(os.path.isfile, path):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    etag = f'"{blob.hash}"'
+    # Ältere Einträge können noch einen beliebigen Typ aus der Data-URL tragen: nur als Download ausliefern
+    is_image = blob.media_type in blobstore.IMAGE_TYPES.values()
+    media_type = blob.media_type if is_image else "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "default-src 'none'; sandbox",
+        "Content-Disposition": f'{"inline" if is_image else "attachment"}; filename="{blob.hash}"',
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # FileResponse liest die Datei in einem Worker-Thread
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 
 @app.post("/api/register", response_model=schemas.User, tags=["Benutzer & Auth"])
-def register_user(user: schemas.UserCreate, db: Session = Depends(auth.get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    db_user = await crud_async.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    # Lesetransaktion beenden, damit die Verbindung während bcrypt zurück in den Pool geht
+    await db.commit()
+    hashed_password = await passwords.hash_password(user.password)
+    return await crud_async.create_user(db=db, user=user, hashed_password=hashed_password)
 
 
 @app.post("/api/token", response_model=schemas.Token, tags=["Benutzer & Auth"])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not crud.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    user = await crud_async.get_user_by_username(db, username=form_data.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    await db.commit()
+    valid, new_hash = await passwords.verify_and_update(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        # Kostenfaktor hat sich geändert: Hash transparent erneuern
+        await crud_async.update_user_password(db=db, user=user, hashed_password=new_hash)
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+async def _load_user(db: AsyncSession, current_user: auth.CurrentUser) -> models.User:
+    user = await crud_async.get_user_by_id(db, user_id=current_user.id)
+    if user is None:
+        auth.user_cache.invalidate(current_user.username)
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return user
+
+
 @app.get("/api/profile", response_model=schemas.Profile, tags=["Benutzer & Auth"])
-async def read_user_profile(current_user: models.User = Depends(auth.get_current_user)):
-    return current_user
+async def read_user_profile(current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                            db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    return await _load_user(db, current_user)
 
 
 @app.put("/api/profile", response_model=schemas.Profile, tags=["Benutzer & Auth"])
 async def update_profile(profile_data: schemas.ProfileUpdate,
-                         current_user: models.User = Depends(auth.get_current_user),
-                         db: Session = Depends(auth.get_db)):
-    return crud.update_user_profile(db=db, user=current_user, profile_data=profile_data)
+                         current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                         db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    user = await _load_user(db, current_user)
+    try:
+        return await crud_async.update_user_profile(db=db, user=user, profile_data=profile_data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid profile picture")
 
 
 @app.put("/api/profile/password", status_code=status.HTTP_204_NO_CONTENT, tags=["Benutzer & Auth"])
 async def update_password(password_data: schemas.PasswordUpdate,
-                          current_user: models.User = Depends(auth.get_current_user),
-                          db: Session = Depends(auth.get_db)):
-    if not crud.verify_password(password_data.current_password, current_user.hashed_password):
+                          current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                          db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    user = await _load_user(db, current_user)
+    await db.commit()
+    if not await passwords.verify_password(password_data.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect current password")
-    crud.update_user_password(db=db, user=current_user, new_password=password_data.new_password)
+    hashed_password = await passwords.hash_password(password_data.new_password)
+    await crud_async.update_user_password(db=db, user=user, hashed_password=hashed_password)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.get("/api/stats/user-cache", tags=["Benutzer & Auth"])
+async def read_user_cache_stats(current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    return auth.user_cache.stats()
+
+
+# --- SUCHE ---
+@app.get("/api/search", response_model=schemas.SearchResults, tags=["AI & Chat"])
+async def search_messages(q: str = Query(..., min_length=1, max_length=200),
+                          chat_id: Optional[int] = None,
+                          limit: int = Query(20, ge=1, le=100),
+                          offset: int = Query(0, ge=0),
+                          current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                          db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    return await search.search_messages(db, owner_id=current_user.id, query=q, limit=limit, offset=offset,
+                                        chat_id=chat_id)
+
+
+# Chat-Liste und Verlauf liefern Spalten-Tupel direkt als orjson (komprimiert); response_model dient nur der Doku.
+# Die Chat-Liste ändert sich nur mit chat_summaries.version (siehe crud.bump_chat_summary), daher reicht die
+# Version als ETag. no-cache: der Browser darf speichern, muss aber jedes Mal mit If-None-Match nachfragen.
+def _chat_list_headers(owner_id: int, version: int) -> dict:
+    return {"ETag": f'W/"chats-{owner_id}-{version}"', "Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    # Schwacher Vergleich: Proxys können W/ ergänzen oder entfernen
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return if_none_match.strip() == "*" or etag.removeprefix("W/") in tags
+
+
 @app.get("/api/chats", response_model=List[schemas.ChatInfo], tags=["AI & Chat"])
-async def read_chats(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
-    return crud.get_chats_by_owner(db, owner_id=current_user.id)
+async def read_chats(request: Request, current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                     db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    # Version vor der Liste lesen: ein gleichzeitiger Schreibzugriff führt höchstens zu einer neueren Liste
+    # unter dem alten ETag, nie umgekehrt
+    summary = await crud_async.get_chat_summary(db, owner_id=current_user.id)
+    headers = _chat_list_headers(current_user.id, summary.version)
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    chats = await crud_async.get_chat_list_payload(db, owner_id=current_user.id)
+    response = fastresponse.FastJSONResponse(chats, headers=headers)
+    return await response.compress_for(request)
+
+
+@app.get("/api/chats/summary", response_model=schemas.ChatSummary, tags=["AI & Chat"])
+async def read_chat_summary(request: Request, response: Response,
+                            current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                            db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    summary = await crud_async.get_chat_summary(db, owner_id=current_user.id)
+    headers = _chat_list_headers(current_user.id, summary.version)
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return summary
 
 
 @app.post("/api/chats", response_model=schemas.ChatInfo, status_code=status.HTTP_201_CREATED, tags=["AI & Chat"])
-async def create_new_chat(current_user: models.User = Depends(auth.get_current_user),
-                          db: Session = Depends(auth.get_db)):
+async def create_new_chat(current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                          db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    # Vorab angelegte ID aus dem Pool; nur wenn er leer ist, wird synchron beim AI-Server angelegt
+    ai_chat_id = await chatpool.chat_pool.claim(db)
+    if ai_chat_id is None:
+        try:
+            ai_chat_id = await chatpool.create_ai_chat()
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Could not connect to AI service")
+    new_chat = await crud_async.create_chat_for_user(db, title=f"AI Chat #{ai_chat_id}", owner_id=current_user.id,
+                                                     ai_chat_id=ai_chat_id)
+    return new_chat
+
+
+# --- EXPORT / IMPORT (NDJSON) ---
+# Vor /api/chats/{chat_id} registriert, sonst würde "export" als chat_id gelesen.
+@app.get("/api/chats/export", tags=["AI & Chat"])
+async def export_chats(gzip: bool = False, images: Literal["inline", "ref"] = "inline",
+                       current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    # images=inline bettet Bilder als Data-URL ein (portabel), ref exportiert nur die Blob-URLs dieses Servers
+    chunks = chatexport.export_lines(current_user.id, embed_images=images == "inline")
+    filename = "coldnet-chats.ndjson"
+    if gzip:
+        chunks = chatexport.gzip_stream(chunks)
+        filename += ".gz"
+    return StreamingResponse(chunks, media_type="application/gzip" if gzip else "application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.post("/api/chats/import", response_model=schemas.ImportResult, status_code=status.HTTP_201_CREATED,
+          tags=["AI & Chat"])
+async def import_chats(request: Request, current_user: auth.CurrentUser = Depends(auth.get_current_user)):
+    # Body: NDJSON wie von /api/chats/export; gzip per Content-Encoding oder Content-Type application/gzip
+    compressed = (request.headers.get("content-encoding", "").lower() == "gzip"
+                  or request.headers.get("content-type", "").split(";")[0].strip() == "application/gzip")
+    importer = chatexport.ChatImporter(owner_id=current_user.id)
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{AI_SERVER_URL}/chats/")
-            response.raise_for_status()
-            ai_chat_data = response.json()
-            ai_chat_id = ai_chat_data.get("id")
-            if not ai_chat_id:
-                raise HTTPException(status_code=500, detail="AI server did not return a valid chat ID.")
-    except httpx.RequestError:
+        return await importer.run(request.stream(), compressed)
+    except chatexport.ChatImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except httpx.HTTPError:
+        # Jeder importierte Chat braucht einen neuen AI-Chat
         raise HTTPException(status_code=503, detail="Could not connect to AI service")
-    new_chat = crud.create_chat_for_user(db, title=f"AI Chat #{ai_chat_id}", owner_id=current_user.id,
-                                         ai_chat_id=ai_chat_id)
-    return new_chat
 
 
 @app.get("/api/chats/{chat_id}", response_model=schemas.Chat, tags=["AI & Chat"])
-async def read_chat_messages(chat_id: int, current_user: models.User = Depends(auth.get_current_user),
-                             db: Session = Depends(auth.get_db)):
-    chat = crud.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+async def read_chat_messages(chat_id: int, request: Request,
+                             current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                             db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_history_payload(db, chat_id=chat_id, owner_id=current_user.id)
     if chat is None:
         raise HTTPException(status_code=404, detail="Chat not found")
-    return chat
+    return await fastresponse.FastJSONResponse(chat).compress_for(request)
+
+
+@app.get("/api/chats/{chat_id}/messages", response_model=schemas.MessagePage, tags=["AI & Chat"])
+async def read_chat_messages_page(chat_id: int,
+                                  before_id: Optional[int] = None,
+                                  limit: int = Query(50, ge=1, le=200),
+                                  images: Literal["inline", "ref", "omit"] = "ref",
+                                  current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                                  db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    rows = await crud_async.get_messages_page(db, chat_id=chat_id, before_id=before_id, limit=limit,
+                                              with_image_data=images == "inline")
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    messages = []
+    for row in rows:
+        item = schemas.MessagePageItem(id=row.id, chat_id=row.chat_id, content=row.content, sender=row.sender)
+        if row.image_hash and images == "inline":
+            item.image_data = blobstore.encode_data_url(
+                row.media_type, await asyncio.to_thread(blobstore.read_bytes, row.image_hash))
+        elif row.image_hash and images == "ref":
+            item.image_url = f"{blobstore.BLOB_URL_PREFIX}{row.image_hash}"
+        messages.append(item)
+    next_before_id = rows[-1].id if has_more else None
+    return schemas.MessagePage(messages=messages, next_before_id=next_before_id)
 
 
 @app.post("/api/chats/{chat_id}/messages", response_model=schemas.Message, tags=["AI & Chat"])
 async def create_chat_message(chat_id: int, payload: PromptPayload,
-                              current_user: models.User = Depends(auth.get_current_user),
-                              db: Session = Depends(auth.get_db)):
-    chat = crud.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+                              current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                              db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+    # Bild vorab in den Blob-Store legen, damit ungültige Daten vor dem AI-Aufruf auffallen
+    try:
+        image_hash = await crud_async.store_image_value(db, payload.image_base64)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    # Schreibsperre nicht über den AI-Aufruf halten; die Nachrichten schreibt der Message-Writer
+    await db.commit()
     ai_chat_id = chat.ai_chat_id
     ai_payload = {"role": "user", "content": payload.final_prompt, "image_base64": payload.image_base64}
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(f"{AI_SERVER_URL}/chats/{ai_chat_id}/messages/", json=ai_payload)
+        client = upstream.get_client()
+        with await admission.admit("message"):
+            response = await client.post(f"/chats/{ai_chat_id}/messages/", json=ai_payload,
+                                         timeout=upstream.timeout_for("message"))
             response.raise_for_status()
-            bot_response_data = response.json()
+        bot_response_data = response.json()
     except httpx.RequestError:
         raise HTTPException(status_code=503, detail="AI service unavailable")
 
-    user_message = schemas.MessageCreate(content=payload.user_text, sender="user", image_data=payload.image_base64)
-    crud.create_message(db, message=user_message, chat_id=chat_id)
-
+    image_ref = f"{blobstore.BLOB_URL_PREFIX}{image_hash}" if image_hash else None
+    user_message = schemas.MessageCreate(content=payload.user_text, sender="user", image_data=image_ref)
     bot_message_content = bot_response_data.get("content", "No response.")
     bot_message = schemas.MessageCreate(content=bot_message_content, sender="coldBot")
-    db_bot_message = crud.create_message(db, message=bot_message, chat_id=chat_id)
+    _, bot_message_id = await messagewriter.message_writer.write(chat_id, [user_message, bot_message])
+
+    return schemas.Message(id=bot_message_id, chat_id=chat_id, **bot_message.model_dump())
+
+
+# --- TEXT-STREAMING (SSE) ---
+# Laufende Relay-Tasks (Text und Audio); die Referenz verhindert, dass der GC sie vor dem Persistieren einsammelt.
+_relay_tasks = set()
+
+
+# Ob der AI-Server /chats/{id}/messages/stream anbietet (None = noch unbekannt). Ohne die Route wird die
+# blockierende Nachrichten-Route genutzt und die Antwort als ein einziges Token-Event weitergegeben.
+_upstream_text_streaming: Optional[bool] = None
+
+
+async def _ai_reply_chunks(client: httpx.AsyncClient, ai_chat_id: int, ai_payload: dict) -> AsyncGenerator[str, None]:
+    global _upstream_text_streaming
+    if _upstream_text_streaming is not False:
+        async with client.stream("POST", f"/chats/{ai_chat_id}/messages/stream", json=ai_payload,
+                                 timeout=upstream.timeout_for("message_stream")) as response:
+            if response.status_code not in (404, 405) or _upstream_text_streaming:
+                response.raise_for_status()
+                _upstream_text_streaming = True
+                async for text in response.aiter_text():
+                    if text:
+                        yield text
+                return
+    response = await client.post(f"/chats/{ai_chat_id}/messages/", json=ai_payload,
+                                 timeout=upstream.timeout_for("message"))
+    response.raise_for_status()
+    # Erst jetzt merken: ein 404 für einen unbekannten Chat sagt nichts über die Streaming-Route aus
+    _upstream_text_streaming = False
+    yield response.json().get("content", "No response.")
+
+
+async def _relay_text_stream(chat_id: int, ai_chat_id: int, payload: PromptPayload,
+                             image_hash: Optional[str], events: asyncio.Queue, slot: admission.Admission):
+    """
+    Liest die Antwort des AI-Servers Token für Token und legt sie als Events in die Queue.
+    Läuft unabhängig vom Client: auch nach einem Verbindungsabbruch wird der Austausch vollständig gespeichert.
+    """
+    ai_payload = {"role": "user", "content": payload.final_prompt, "image_base64": payload.image_base64}
+    parts = []
+    try:
+        client = upstream.get_client()
+        with slot:
+            async with aclosing(_ai_reply_chunks(client, ai_chat_id, ai_payload)) as chunks:
+                async for text in chunks:
+                    parts.append(text)
+                    events.put_nowait(("token", {"text": text}))
+    except httpx.HTTPError as exc:
+        # Ohne vollständige Antwort wird nichts gespeichert; ein späterer /sync gleicht ab.
+        events.put_nowait(("error", {"detail": f"AI service unavailable: {exc}"}))
+        return
+    except Exception as exc:
+        # z. B. eine fehlerhafte Zeile vom AI-Server: ohne Error-Event würde event_stream ewig auf die Queue warten
+        print(f"Stream-Relay für Chat {chat_id} abgebrochen: {exc!r}")
+        events.put_nowait(("error", {"detail": f"Invalid response from AI service: {exc}"}))
+        return
+
+    image_ref = f"{blobstore.BLOB_URL_PREFIX}{image_hash}" if image_hash else None
+    user_message = schemas.MessageCreate(content=payload.user_text, sender="user", image_data=image_ref)
+    bot_message = schemas.MessageCreate(content="".join(parts) or "No response.", sender="coldBot")
+    try:
+        _, bot_message_id = await messagewriter.message_writer.write(chat_id, [user_message, bot_message])
+    except Exception as exc:
+        events.put_nowait(("error", {"detail": f"Could not store message: {exc}"}))
+        return
+    db_bot_message = schemas.Message(id=bot_message_id, chat_id=chat_id, **bot_message.model_dump())
+    events.put_nowait(("done", db_bot_message.model_dump()))
+
+
+@app.post("/api/chats/{chat_id}/messages/stream", tags=["AI & Chat"])
+async def stream_chat_message(chat_id: int, payload: PromptPayload,
+                              current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                              db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    try:
+        image_hash = await crud_async.store_image_value(db, payload.image_base64)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    await db.commit()
 
-    return db_bot_message
+    # Slot vor dem Start des Streams reservieren, damit eine Ablehnung noch als 503 beim Client ankommt
+    slot = await admission.admit("message_stream")
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_relay_text_stream(chat_id, chat.ai_chat_id, payload, image_hash, events, slot))
+    _relay_tasks.add(task)
+    task.add_done_callback(_relay_tasks.discard)
+
+    async def event_stream() -> AsyncGenerator[bytes, None]:
+        while True:
+            event, data = await events.get()
+            yield sse_event(event, data)
+            if event in ("done", "error"):
+                break
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.put("/api/chats/{chat_id}", response_model=schemas.ChatInfo, tags=["AI & Chat"])
-def update_chat_details(chat_id: int, update_data: schemas.ChatUpdate,
-                        current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
-    chat = crud.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+async def update_chat_details(chat_id: int, update_data: schemas.ChatUpdate,
+                              current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                              db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
     if update_data.is_pinned is not None and update_data.is_pinned:
-        all_chats = crud.get_chats_by_owner(db, owner_id=current_user.id)
-        pinned_count = sum(1 for c in all_chats if c.is_pinned)
-        if pinned_count >= 5 and not chat.is_pinned:
+        summary = await crud_async.get_chat_summary(db, owner_id=current_user.id)
+        if summary.pinned_count >= 5 and not chat.is_pinned:
             raise HTTPException(status_code=400, detail="Maximum of 5 pinned chats reached.")
 
-    return crud.update_chat(db=db, chat=chat, update_data=update_data)
+    return await crud_async.update_chat(db=db, chat=chat, update_data=update_data)
 
 
 @app.delete("/api/chats/{chat_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["AI & Chat"])
-def delete_chat(chat_id: int, current_user: models.User = Depends(auth.get_current_user),
-                db: Session = Depends(auth.get_db)):
-    chat = crud.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+async def delete_chat(chat_id: int, current_user: auth.CurrentUser = Depends(auth.get_current_user),
+                      db: AsyncSession = Depends(auth.get_async_db, scope="function")):
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
-    crud.delete_chat(db=db, chat=chat)
+    await crud_async.delete_chat(db=db, chat=chat)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+async def _fetch_ai_history(ai_chat_id: int) -> List[schemas.MessageCreate]:
+    client = upstream.get_client()
+    with await admission.admit("sync"):
+        response = await client.get(f"/chats/{ai_chat_id}/messages/", timeout=upstream.timeout_for("sync"))
+        response.raise_for_status()
+    return [crud.message_from_ai(msg) for msg in response.json()]
+
+
+async def _persist_voice_turn(chat_id: int, ai_chat_id: int):
+    """Übernimmt Prompt und Bot-Transkript des Sprach-Turns über den inkrementellen Sync."""
+    try:
+        ai_messages = await _fetch_ai_history(ai_chat_id)
+        async with AsyncSessionLocal() as db:
+            sync_state = await crud_async.get_sync_state(db, chat_id=chat_id)
+            await crud_async.sync_chat_messages(db, chat_id=chat_id, state=sync_state, ai_messages=ai_messages)
+            await db.commit()
+    except Exception as e:
+        print(f"Sprach-Turn für Chat {chat_id} konnte nicht gespeichert werden: {e}")
+
+
+async def _relay_audio_frames(chat_id: int, ai_chat_id: int, payload: dict, relay: audioframes.FrameRelay,
+                              slot: admission.Admission) -> bool:
+    parser = audioframes.FrameParser()
+    completed = False
+    try:
+        client = upstream.get_client()
+        with slot:
+            async with client.stream("POST", f"/chats/{ai_chat_id}/messages/stream-audio", json=payload,
+                                     timeout=upstream.timeout_for("stream_audio")) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    for frame in parser.feed(chunk):
+                        await relay.send(frame)
+        if parser.pending_bytes:
+            print(f"Audio-Stream für Chat {chat_id} endete mit {parser.pending_bytes} Bytes eines unvollständigen Frames.")
+        completed = True
+    except (httpx.HTTPError, audioframes.FrameProtocolError) as e:
+        print(f"Proxy-Fehler beim Streamen zum AI-Server: {e}")
+    finally:
+        await relay.close()
+    print(f"Audio-Stream Chat {chat_id}: {relay.stats.summary()}")
+    if completed:
+        await _persist_voice_turn(chat_id, ai_chat_id)
+    return completed
+
+
 @app.post("/api/chats/{chat_id}/messages/stream-audio", tags=["AI & Chat"])
 async def proxy_stream_audio(
     chat_id: int,
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(auth.get_async_db, scope="function")
 ):
-    chat = crud.get_chat_by_id(db=next(auth.get_db()), chat_id=chat_id, owner_id=current_user.id)
+    chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
-    
-    ai_chat_id = chat.ai_chat_id
-    ai_server_url = f"{AI_SERVER_URL}/chats/{ai_chat_id}/messages/stream-audio"
     payload = await request.json()
 
-    async def stream_generator() -> AsyncGenerator[bytes, None]:
+    # Der Relay-Task liest unabhängig vom Client weiter, damit der Turn auch nach einem Abbruch gespeichert wird.
+    slot = await admission.admit("stream_audio")
+    relay = audioframes.FrameRelay()
+    task = asyncio.create_task(_relay_audio_frames(chat_id, chat.ai_chat_id, payload, relay, slot))
+    _relay_tasks.add(task)
+    task.add_done_callback(_relay_tasks.discard)
+
+    return StreamingResponse(relay.frames(), media_type="application/octet-stream")
+
+# --- SPRACHKANAL (WebSocket) ---
+# Gleiche Vorlage wie im Frontend, wenn zuvor ein Bild beschrieben wurde
+VOICE_PROMPT_TEMPLATE = 'Basierend auf der folgenden Szene: "{context}". Beantworte die Frage: "{text}"'
+
+
+class VoiceSession:
+    """
+    Ein Sprach-Turn pro Äußerung über einen WebSocket. Client -> Server:
+      {"type": "start", "format": "webm"|"pcm_s16le", "sample_rate": 16000, "context": ..., "image_base64": ...},
+      danach Audio als Binär-Nachrichten, dann {"type": "end"} oder {"type": "cancel"}.
+    Server -> Client: {"type": "transcript"}, die Audio-Frames der Antwort (4 Byte Länge + WAV) als Binär-Nachrichten,
+    zum Schluss {"type": "turn_done"} oder {"type": "error"}.
+    Die Audio-Chunks laufen schon während der Aufnahme durch ffmpeg zum STT. Ein neues "start" bricht den
+    laufenden Turn ab (Barge-in); der Relay-Task liest die Antwort trotzdem zu Ende und speichert sie.
+    """
+
+    def __init__(self, websocket: WebSocket, chat_id: int, ai_chat_id: int):
+        self.websocket = websocket
+        self.chat_id = chat_id
+        self.ai_chat_id = ai_chat_id
+        self._send_lock = asyncio.Lock()
+        self._source: Optional[audio.LiveAudioSource] = None
+        self._turn: Optional[asyncio.Task] = None
+
+    async def send_json(self, data: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(data)
+
+    async def send_bytes(self, data: bytes):
+        async with self._send_lock:
+            await self.websocket.send_bytes(data)
+
+    async def send_error(self, detail: str, **extra):
+        await self.send_json({"type": "error", "detail": detail, **extra})
+
+    async def start_turn(self, message: dict):
+        await self.cancel_turn()
+        audio_format = message.get("format", "webm")
+        if audio_format == "pcm_s16le":
+            try:
+                sample_rate = int(message.get("sample_rate", 16000))
+            except (TypeError, ValueError, OverflowError):
+                sample_rate = 0
+            # Geht als Argument an ffmpeg; ein ungültiger Wert darf den Socket nicht beenden
+            if not 8000 <= sample_rate <= 192000:
+                await self.send_error(f"Invalid sample_rate: {message.get('sample_rate')!r}")
+                return
+            input_args = audio.pcm_input_args(sample_rate)
+        elif audio_format == "webm":
+            input_args = []
+        else:
+            await self.send_error(f"Unsupported audio format: {audio_format}")
+            return
+        self._source = audio.LiveAudioSource()
+        self._turn = asyncio.create_task(self._run_turn(self._source, input_args, message.get("context"),
+                                                        message.get("image_base64")))
+
+    async def feed(self, chunk: bytes):
+        if self._source is None:
+            await self.send_error("Audio received without an active turn")
+            return
         try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                async with client.stream("POST", ai_server_url, json=payload, timeout=None) as response:
-                    response.raise_for_status()
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
-        except httpx.RequestError as e:
-            print(f"Proxy-Fehler beim Streamen zum AI-Server: {e}")
-            pass
+            self._source.feed(chunk)
+        except audio.UtteranceTooLong as e:
+            await self.cancel_turn()
+            await self.send_error(str(e))
+
+    def end_turn(self):
+        if self._source is not None:
+            self._source.finish()
+            self._source = None
+
+    async def cancel_turn(self):
+        self.end_turn()
+        if self._turn is not None:
+            # auch bei beendetem Task abholen, damit dessen Exception nicht unbeachtet bleibt
+            self._turn.cancel()
+            try:
+                await self._turn
+            except (asyncio.CancelledError, WebSocketDisconnect):
+                pass
+            except Exception as e:
+                print(f"Sprach-Turn in Chat {self.chat_id} mit Fehler beendet: {e!r}")
+        self._turn = None
+
+    async def _run_turn(self, source: audio.LiveAudioSource, input_args: Sequence[str], context: Optional[str],
+                        image_base64: Optional[str]):
+        timings = audio.StageTimer()
+        try:
+            result = await _transcribe(source, timings, input_args)
+        except admission.UpstreamUnavailable as e:
+            await self.send_error(f"AI service is overloaded or unavailable: {e.reason}", retry_after=e.retry_after)
+            return
+        except httpx.HTTPError as e:
+            await self.send_error(f"AI-Dienst für STT nicht erreichbar: {e}")
+            return
+        except (audio.FfmpegError, OSError) as e:
+            await self.send_error(f"Audio-Vorverarbeitung fehlgeschlagen: {e}")
+            return
+        text = (result.get("text") or "").strip()
+        await self.send_json({"type": "transcript", "text": text, "server_timing": timings.server_timing()})
+        if not text:
+            await self.send_json({"type": "turn_done"})
+            return
+
+        content = VOICE_PROMPT_TEMPLATE.format(context=context, text=text) if context else text
+        payload = {"role": "user", "content": content, "image_base64": image_base64}
+        try:
+            slot = await admission.admit("stream_audio")
+        except admission.UpstreamUnavailable as e:
+            await self.send_error(f"AI service is overloaded or unavailable: {e.reason}", retry_after=e.retry_after)
+            return
+        relay = audioframes.FrameRelay()
+        task = asyncio.create_task(_relay_audio_frames(self.chat_id, self.ai_chat_id, payload, relay, slot))
+        _relay_tasks.add(task)
+        task.add_done_callback(_relay_tasks.discard)
+        async with aclosing(relay.frames()) as frames:
+            async for frame in frames:
+                await self.send_bytes(frame)
+        # Erst nach dem Speichern melden, damit der Client den Chat ohne eigenen /sync neu laden kann
+        if await asyncio.shield(task):
+            await self.send_json({"type": "turn_done"})
+        else:
+            await self.send_error("AI audio stream failed")
+
+
+@app.websocket("/api/chats/{chat_id}/voice")
+async def voice_channel(websocket: WebSocket, chat_id: int, token: str = Query(...)):
+    # Browser können beim WebSocket-Handshake keinen Authorization-Header setzen, daher ?token=
+    async with AsyncSessionLocal() as db:
+        try:
+            current_user = await auth.resolve_user(db, token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        chat = await crud_async.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
+    if not chat:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    session = VoiceSession(websocket, chat_id, chat.ai_chat_id)
+    try:
+        await session.send_json({"type": "ready"})
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await session.feed(message["bytes"])
+                continue
+            try:
+                data = json.loads(message.get("text") or "")
+            except ValueError:
+                await session.send_error("Invalid JSON message")
+                continue
+            kind = data.get("type") if isinstance(data, dict) else None
+            if kind == "start":
+                await session.start_turn(data)
+            elif kind == "end":
+                session.end_turn()
+            elif kind == "cancel":
+                await session.cancel_turn()
+            else:
+                await session.send_error(f"Unknown message type: {kind}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.cancel_turn()
 
-    return StreamingResponse(stream_generator(), media_type="application/octet-stream")
 
 # --- NEUER SYNC ENDPUNKT ---
 @app.post("/api/chats/{chat_id}/sync", status_code=status.HTTP_204_NO_CONTENT, tags=["AI & Chat"])
 async def sync_chat_history(
     chat_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(auth.get_db)
+    full: bool = False,
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(auth.get_async_db, scope="function")
 ):
-    chat = crud.get_chat_by_id(db, chat_id=chat_id, owner_id=current_user.id)
-    if not chat:
+    row = await crud_async.get_chat_with_sync_state(db, chat_id=chat_id, owner_id=current_user.id)
+    if not row:
         raise HTTPException(status_code=404, detail="Chat not found")
-
-    ai_chat_id = chat.ai_chat_id
-    ai_server_url = f"{AI_SERVER_URL}/chats/{ai_chat_id}/messages/"
+    chat, sync_state = row
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(ai_server_url)
-            response.raise_for_status()
-            ai_messages = response.json()
-
-        db.query(models.Message).filter(models.Message.chat_id == chat_id).delete(synchronize_session=False)
+        ai_messages = await _fetch_ai_history(chat.ai_chat_id)
 
-        for msg in ai_messages:
-            sender = "user" if msg.get("role") == "user" else "coldBot"
-            message_to_create = schemas.MessageCreate(
-                sender=sender,
-                content=msg.get("content"),
-                image_data=msg.get("image_base64") # Annahme, dass der AI-Server dies bereitstellt
-            )
-            crud.create_message(db, message=message_to_create, chat_id=chat_id)
-        
-        db.commit()
+        await crud_async.sync_chat_messages(db, chat_id=chat_id, state=sync_state, ai_messages=ai_messages, full=full)
+        await db.commit()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+    except admission.UpstreamUnavailable:
+        await db.rollback()
+        raise
     except httpx.RequestError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=503, detail=f"Could not connect to AI service for sync: {e}")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"An error occurred during sync: {e}")
@@ -0,0 +1,155 @@
+# backend/messagewriter.py
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from . import crud, metrics, schemas
+from .models import AsyncSessionLocal
+
+# --- Konfiguration ---
+# So lange wartet der Writer nach dem ersten Eintrag auf weitere, bevor er committet (0 = nur was schon wartet)
+MESSAGE_WRITER_MAX_DELAY_MS = float(os.getenv("MESSAGE_WRITER_MAX_DELAY_MS", "5"))
+# Spätestens bei so vielen Nachrichten wird der Batch geschrieben
+MESSAGE_WRITER_MAX_ROWS = int(os.getenv("MESSAGE_WRITER_MAX_ROWS", "200"))
+
+
+@dataclass
+class _PendingWrite:
+    chat_id: int
+    messages: List[schemas.MessageCreate]
+    advance_sync: bool
+    future: asyncio.Future
+
+
+def _write_items(session: Session, batch: List[_PendingWrite]) -> List[List[int]]:
+    results = []
+    for item in batch:
+        results.append(crud.insert_messages(session, item.messages, item.chat_id))
+        if item.advance_sync:
+            crud.advance_sync_state(session, item.chat_id, added=len(item.messages), last_message=item.messages[-1])
+    return results
+
+
+class MessageWriter:
+    """
+    Group Commit für neue Nachrichten: ein Hintergrund-Task sammelt die Einträge vieler Requests und schreibt
+    sie in einer gemeinsamen Transaktion. write() kehrt erst nach dem Commit mit den IDs zurück.
+    Scheitert ein Batch, werden seine Einträge einzeln wiederholt, damit nur der fehlerhafte Eintrag scheitert.
+    """
+
+    def __init__(self, max_delay: float, max_rows: int):
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_rows = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.failed_writes = 0
+
+    async def write(self, chat_id: int, messages: Sequence[schemas.MessageCreate],
+                    advance_sync: bool = True) -> List[int]:
+        """
+        Speichert messages in chat_id und gibt ihre IDs zurück. advance_sync zieht den Sync-Wasserstand nach
+        (für Austausche, die der AI-Server bereits selbst gespeichert hat).
+        """
+        item = _PendingWrite(chat_id, list(messages), advance_sync, asyncio.get_running_loop().create_future())
+        if self._task is None:
+            # Writer läuft nicht (Start/Shutdown, Skripte): direkt schreiben
+            await self._commit([item])
+        else:
+            self._queue.put_nowait(item)
+        return await item.future
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Schreibt noch wartende Einträge und beendet den Task."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._queue.put_nowait(None)
+        await task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            rows = len(item.messages)
+            deadline = loop.time() + self.max_delay
+            stopping = False
+            while rows < self.max_rows:
+                try:
+                    if not self._queue.empty():
+                        item = self._queue.get_nowait()
+                    elif deadline > loop.time():
+                        item = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                    else:
+                        break
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item.messages)
+            await self._commit(batch)
+            if stopping:
+                return
+
+    async def _commit(self, batch: List[_PendingWrite]):
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                results = await db.run_sync(_write_items, batch)
+                await db.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed_writes += 1
+                if not batch[0].future.done():
+                    batch[0].future.set_exception(e)
+                return
+            print(f"Nachrichten-Batch mit {len(batch)} Einträgen fehlgeschlagen, schreibe einzeln: {e}")
+            for item in batch:
+                await self._commit([item])
+            return
+        elapsed = time.perf_counter() - started
+        rows = sum(len(item.messages) for item in batch)
+        self.batches += 1
+        self.rows += rows
+        self.max_batch_rows = max(self.max_batch_rows, rows)
+        self.commit_seconds += elapsed
+        self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+        metrics.message_batch_rows.observe(rows)
+        metrics.message_commit_duration.observe(elapsed)
+        for item, ids in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(ids)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self._task is not None,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0,
+            "max_batch_rows": self.max_batch_rows,
+            "avg_commit_ms": round(self.commit_seconds / self.batches * 1000, 2) if self.batches else 0,
+            "max_commit_ms": round(self.max_commit_seconds * 1000, 2),
+            "failed_writes": self.failed_writes,
+        }
+
+
+message_writer = MessageWriter(MESSAGE_WRITER_MAX_DELAY_MS / 1000, MESSAGE_WRITER_MAX_ROWS)
@@ -0,0 +1,281 @@
+# backend/metrics.py
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+# Kleine, abhängigkeitsfreie Metrik-Registry im Prometheus-Textformat (Version 0.0.4).
+
+# --- Konfiguration ---
+# Ab so vielen Queries in einem Request wird eine Warnung ausgegeben (typisch für N+1-Muster)
+METRICS_QUERY_WARN = int(os.getenv("METRICS_QUERY_WARN", "50"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+LabelValues = Tuple[str, ...]
+_INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # je Label-Kombination: [Zähler pro Bucket..., Summe, Anzahl]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, _INF_LABEL)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # Werte, die erst beim Abruf gelesen werden (z.B. Zustand des Circuit Breakers)
+        self._collectors: List[Callable[[], Iterable[Gauge]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Gauge]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+http_requests = registry.register(Counter(
+    "coldnet_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "coldnet_http_request_duration_seconds", "HTTP request latency including streamed bodies.", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "coldnet_http_requests_in_flight", "HTTP requests currently being served.", ("method", "route")))
+
+# --- Datenbank ---
+db_query_duration = registry.register(Histogram(
+    "coldnet_db_query_duration_seconds", "SQL statement execution time.", ("engine", "statement")))
+db_queries_per_request = registry.register(Histogram(
+    "coldnet_db_queries_per_request", "SQL statements issued per HTTP request.", ("method", "route"),
+    buckets=COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    "coldnet_db_time_per_request_seconds", "Total SQL time per HTTP request.", ("method", "route")))
+
+# --- AI-Server und ffmpeg ---
+upstream_duration = registry.register(Histogram(
+    "coldnet_upstream_request_duration_seconds", "Calls to the AI server (streams: until the stream ends).",
+    ("route", "outcome")))
+upstream_rejected = registry.register(Counter(
+    "coldnet_upstream_rejected_total", "AI server calls rejected by admission control.", ("route", "reason")))
+ffmpeg_duration = registry.register(Histogram(
+    "coldnet_ffmpeg_run_seconds", "ffmpeg conversion runs from spawn to exit.", ("filter", "outcome")))
+ffmpeg_queue = registry.register(Histogram(
+    "coldnet_ffmpeg_queue_seconds", "Time spent waiting for a free ffmpeg slot."))
+
+# --- Nachrichten-Writer (Group Commit) ---
+message_batch_rows = registry.register(Histogram(
+    "coldnet_message_writer_batch_rows", "Messages written per group commit.", buckets=COUNT_BUCKETS))
+message_commit_duration = registry.register(Histogram(
+    "coldnet_message_writer_commit_seconds", "Group commit latency (insert and commit)."))
+
+
+# --- Queries pro Request ---
+class RequestQueries:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_request_queries: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar(
+    "coldnet_request_queries", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "WITH") else "OTHER"
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Misst jede SQL-Anweisung der Engine; bei AsyncEngine die sync_engine übergeben."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("coldnet_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["coldnet_query_start"].pop()
+        db_query_duration.observe(elapsed, engine=name, statement=_statement_kind(statement))
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += elapsed
+
+
+# --- Middleware ---
+def _route_template(scope) -> str:
+    # Das Routing läuft erst nach der Middleware; für die in-flight-Zählung wird die Route hier aufgelöst.
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-Middleware: Latenz, Status und in-flight je Route sowie Anzahl/Dauer der SQL-Queries je Request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = _route_template(scope)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries = RequestQueries()
+        token = _request_queries.set(queries)
+        http_in_flight.inc(method=method, route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            http_in_flight.dec(method=method, route=route)
+            http_requests.inc(method=method, route=route, status=str(status_code))
+            http_duration.observe(elapsed, method=method, route=route)
+            db_queries_per_request.observe(queries.count, method=method, route=route)
+            db_time_per_request.observe(queries.seconds, method=method, route=route)
+            if queries.count >= METRICS_QUERY_WARN:
+                print(f"{method} {route}: {queries.count} SQL-Queries in einem Request ({queries.seconds * 1000:.0f}ms)")
+
+
+def render() -> str:
+    return registry.render()
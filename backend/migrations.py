@@ -0,0 +1,167 @@
+# backend/migrations.py
+
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from . import archive, blobstore, crud
+
+# Versionierte Schema-/Datenmigrationen. Die aktuelle Version steht in "PRAGMA user_version".
+# Neue Tabellen legt Base.metadata.create_all an; hier landen nur Änderungen an bestehenden Dateien.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+_BATCH_SIZE = 100
+
+
+def migration(version: int, description: str):
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _columns(conn: Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str):
+    if column not in _columns(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+
+
+@migration(1, "Blob-Hash-Spalten für Nachrichtenbilder und Profilbilder")
+def _add_blob_columns(conn: Connection):
+    _add_column(conn, "messages", "image_hash", "VARCHAR(64)")
+    _add_column(conn, "users", "profile_picture_hash", "VARCHAR(64)")
+
+
+@migration(2, "Inline-Base64-Bilder in den Blob-Store verschieben")
+def _move_inline_images(conn: Connection):
+    for table, data_column, hash_column in (
+        ("messages", "image_data", "image_hash"),
+        ("users", "profile_picture", "profile_picture_hash"),
+    ):
+        # Cursor über die id: übersprungene Zeilen bleiben unverändert und werden nicht erneut gelesen
+        select_batch = text(
+            f"SELECT id, {data_column} FROM {table} "
+            f"WHERE {data_column} IS NOT NULL AND {hash_column} IS NULL AND id > :after "
+            f"ORDER BY id LIMIT {_BATCH_SIZE}"
+        )
+        after = 0
+        while True:
+            rows = conn.execute(select_batch, {"after": after}).fetchall()
+            if not rows:
+                break
+            for row_id, value in rows:
+                after = row_id
+                try:
+                    blob_hash = blobstore.store_image_value(conn, value)
+                except ValueError as e:
+                    # z. B. BMP/TIFF oder abgeschnittene Dateien: der Inline-Wert bleibt erhalten, die Properties
+                    # in models.py liefern ihn weiter aus
+                    print(f"Migration: {table}.{row_id} bleibt inline gespeichert ({e}).")
+                    continue
+                conn.execute(
+                    text(f"UPDATE {table} SET {hash_column} = :hash, {data_column} = NULL WHERE id = :id"),
+                    {"hash": blob_hash, "id": row_id},
+                )
+
+
+@migration(3, "Zusammengesetzte Indizes für Nachrichtenverlauf und Chatliste")
+def _add_composite_indexes(conn: Connection):
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_messages_chat_id_id ON messages (chat_id, id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_chats_owner_pinned_id ON chats (owner_id, is_pinned, id)")
+    conn.exec_driver_sql("ANALYZE")
+
+
+@migration(4, "FTS5-Volltextindex über Nachrichteninhalte")
+def _add_message_search_index(conn: Connection):
+    # External-Content-Tabelle: der Text liegt nur in messages, Trigger halten den Index aktuell
+    # (auch für Bulk-Inserts aus dem Sync und Löschungen über die Chat-Kaskade).
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+@migration(5, "Zeitstempel für Nachrichten (Archivierung nach Alter)")
+def _add_message_timestamps(conn: Connection):
+    _add_column(conn, "messages", "created_at", "DATETIME")
+
+
+@migration(6, "Chat-Übersicht: Nachrichtenzahl, Vorschau und letzte Aktivität")
+def _add_chat_summaries(conn: Connection):
+    _add_column(conn, "chats", "message_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "chats", "last_message_preview", "VARCHAR")
+    _add_column(conn, "chats", "last_activity_at", "DATETIME")
+    conn.exec_driver_sql("""
+        UPDATE chats SET message_count =
+            (SELECT count(*) FROM messages WHERE messages.chat_id = chats.id)
+            + (SELECT coalesce(sum(message_count), 0) FROM message_archive WHERE message_archive.chat_id = chats.id)
+    """)
+    # Vorschau aus der neuesten Nachricht; Altbestand hat keinen Zeitstempel, dann bleibt last_activity_at leer
+    conn.exec_driver_sql(f"""
+        UPDATE chats SET
+            last_message_preview = (SELECT substr(content, 1, {crud.CHAT_PREVIEW_CHARS}) FROM messages
+                                    WHERE messages.chat_id = chats.id ORDER BY id DESC LIMIT 1),
+            last_activity_at = (SELECT max(created_at) FROM messages WHERE messages.chat_id = chats.id)
+    """)
+    # Die Zeilen in chat_summaries legt crud.get_chat_summary beim ersten Zugriff an
+
+
+@migration(7, "Sync-Status: Kennzeichen für importierte Verläufe")
+def _add_local_history_flag(conn: Connection):
+    _add_column(conn, "chat_sync_state", "local_history", "BOOLEAN NOT NULL DEFAULT 0")
+
+
+
+@migration(8, "Volltextindex für archivierte Nachrichten")
+def _add_archive_search_index(conn: Connection):
+    # Eigene Tabelle mit Inhalt: die Segmente sind komprimiert, als External Content taugen sie nicht
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS message_archive_fts USING fts5("
+        "content, chat_id UNINDEXED, sender UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+    )
+    last_id = 0
+    while True:
+        segments = conn.execute(text(
+            "SELECT id, chat_id, codec, payload FROM message_archive "
+            f"WHERE id > :last_id ORDER BY id LIMIT {_BATCH_SIZE}"
+        ), {"last_id": last_id}).fetchall()
+        if not segments:
+            break
+        for segment_id, chat_id, codec, payload in segments:
+            archive.index_archived(conn, chat_id, archive.decompress_segment(codec, payload))
+            last_id = segment_id
+
+
+
+@migration(9, "Tabelle des entfernten Invalidierungskanals löschen")
+def _drop_cache_invalidations(conn: Connection):
+    conn.exec_driver_sql("DROP TABLE IF EXISTS cache_invalidations")
+
+
+def run_migrations(engine: Engine):
+    with engine.begin() as conn:
+        current = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current:
+                continue
+            print(f"Migration {version}: {description}")
+            fn(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {version}")
@@ -1,18 +1,16 @@
 # backend/models.py
 
-from sqlalchemy import create_engine, Column, ForeignKey, Integer, String, Text, Boolean, Date
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from datetime import datetime
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, LargeBinary, String, Text, Boolean, Date, DateTime
+from sqlalchemy.orm import relationship
 
 # --- Database Setup ---
-SQLALCHEMY_DATABASE_URL = "sqlite:///./coldnet.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False, "timeout": 300}
-)
-# WICHTIG: SessionLocal wird jetzt auch in main.py verwendet
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+# Engines, Sessions und Base kommen aus database.py (ein gemeinsames SQLite-Profil für sync und async)
+from .database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+
+# Bilder werden über ihren Inhalts-Hash aus dem Blob-Store ausgeliefert (siehe blobstore.py)
+BLOB_URL_PREFIX = "/api/blobs/"
 
 # --- ORM Models ---
 class User(Base):
@@ -22,17 +20,31 @@ class User(Base):
     hashed_password = Column(String)
     real_name = Column(String, nullable=True)
     birth_date = Column(Date, nullable=True)
-    profile_picture = Column(Text, nullable=True)
+    # Altspalte mit Base64-Daten; wird von der Migration in den Blob-Store verschoben
+    profile_picture_inline = Column("profile_picture", Text, nullable=True)
+    profile_picture_hash = Column(String(64), nullable=True)
     
     chats = relationship("Chat", back_populates="owner")
 
+    @property
+    def profile_picture(self):
+        if self.profile_picture_hash:
+            return f"{BLOB_URL_PREFIX}{self.profile_picture_hash}"
+        return self.profile_picture_inline
+
 class Chat(Base):
     __tablename__ = "chats"
+    # Sidebar-Sortierung: WHERE owner_id = ? ORDER BY is_pinned DESC, id DESC
+    __table_args__ = (Index("ix_chats_owner_pinned_id", "owner_id", "is_pinned", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     is_pinned = Column(Boolean, default=False, nullable=False)
     ai_chat_id = Column(Integer, index=True, nullable=False)
+    # Für die Sidebar, bei jedem Schreibzugriff gepflegt (siehe crud.note_new_messages); inkl. archivierter
+    message_count = Column(Integer, default=0, nullable=False)
+    last_message_preview = Column(String, nullable=True)
+    last_activity_at = Column(DateTime, nullable=True)
     
     owner = relationship("User", back_populates="chats")
     messages = relationship(
@@ -41,12 +53,85 @@ class Chat(Base):
         cascade="all, delete-orphan",
         order_by="Message.id"
     )
+    sync_state = relationship(
+        "ChatSyncState",
+        back_populates="chat",
+        uselist=False,
+        cascade="all, delete-orphan"
+    )
 
 class Message(Base):
     __tablename__ = "messages"
+    # Verlauf und Keyset-Pagination: WHERE chat_id = ? ORDER BY id
+    __table_args__ = (Index("ix_messages_chat_id_id", "chat_id", "id"),)
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
     sender = Column(String)
-    image_data = Column(Text, nullable=True)
+    # Altspalte mit Base64-Daten; wird von der Migration in den Blob-Store verschoben
+    image_data_inline = Column("image_data", Text, nullable=True)
+    image_hash = Column(String(64), nullable=True)
     chat_id = Column(Integer, ForeignKey("chats.id"))
+    # Für die Archivierung nach Alter; Zeilen von vor Migration 5 haben keinen Zeitstempel
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow)
     chat = relationship("Chat", back_populates="messages")
+
+    @property
+    def image_data(self):
+        if self.image_hash:
+            return f"{BLOB_URL_PREFIX}{self.image_hash}"
+        return self.image_data_inline
+
+# Wasserstand des letzten Syncs mit dem AI-Server (Anzahl + Fingerprint der letzten gespiegelten Nachricht)
+class ChatSyncState(Base):
+    __tablename__ = "chat_sync_state"
+    chat_id = Column(Integer, ForeignKey("chats.id"), primary_key=True)
+    ai_message_count = Column(Integer, default=0, nullable=False)
+    last_message_hash = Column(String, nullable=True)
+    # Verlauf stammt (auch) aus einem Import und existiert nur hier; ein Sync darf ihn nie ersetzen
+    local_history = Column(Boolean, default=False, nullable=False)
+    chat = relationship("Chat", back_populates="sync_state")
+
+# Chat-Übersicht pro Benutzer. version steigt bei jeder Änderung an der Chat-Liste und dient als ETag
+# für GET /api/chats; pinned_count macht die Prüfung auf maximal 5 angeheftete Chats zu einem Lookup.
+class ChatSummary(Base):
+    __tablename__ = "chat_summaries"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=1, nullable=False)
+    chat_count = Column(Integer, default=0, nullable=False)
+    pinned_count = Column(Integer, default=0, nullable=False)
+    message_count = Column(Integer, default=0, nullable=False)
+    last_message_preview = Column(String, nullable=True)
+    last_activity_at = Column(DateTime, nullable=True)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    hash = Column(String(64), primary_key=True)
+    media_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+
+# Ergebnis von /describe-image/, nach Inhalts-Hash des hochgeladenen Bildes (siehe imagepipe.py)
+class ImageDescription(Base):
+    __tablename__ = "image_descriptions"
+    hash = Column(String(64), primary_key=True)
+    response_json = Column(Text, nullable=False)
+
+# Archivierte Nachrichten eines Chats als komprimiertes Segment (siehe archive.py). Segmente enthalten immer
+# den ältesten Teil des Verlaufs: alle archivierten IDs eines Chats sind kleiner als die in messages.
+class MessageArchive(Base):
+    __tablename__ = "message_archive"
+    __table_args__ = (Index("ix_message_archive_chat_first", "chat_id", "first_id"),)
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    codec = Column(String(8), nullable=False)
+    raw_size = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Vorab beim AI-Server angelegte, noch keinem Benutzer zugeordnete Chats (siehe chatpool.py)
+class PooledAIChat(Base):
+    __tablename__ = "ai_chat_pool"
+    ai_chat_id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, nullable=False)
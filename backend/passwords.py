@@ -0,0 +1,67 @@
+# backend/passwords.py
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from . import workers
+
+# --- Konfiguration ---
+# bcrypt gibt den GIL frei, daher skaliert ein Thread-Pool über alle Kerne (bei mehreren Worker-Prozessen
+# bekommt jeder seinen Anteil).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(workers.per_worker(os.cpu_count() or 2))))
+# Maximale Anzahl wartender + laufender Hash-Jobs, danach wird mit 503 abgewiesen.
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 8)))
+PASSWORD_RETRY_AFTER = 1
+
+# min = max = default: Hashes mit abweichenden Kosten werden beim nächsten Login neu berechnet.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_MAX_PENDING:
+        raise PasswordServiceBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Wie verify_password, liefert zusätzlich einen neuen Hash, falls sich die Kosten geändert haben."""
+    return await _run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+def pending() -> int:
+    return _pending
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,8 @@
 # backend/schemas.py
 
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import date
+from typing import List, Literal, Optional
+from datetime import date, datetime
 
 class MessageBase(BaseModel):
     content: str
@@ -18,6 +18,33 @@ class Message(MessageBase):
     class Config:
         from_attributes = True
 
+# --- Seitenweise Nachrichten (neueste zuerst) ---
+class MessagePageItem(BaseModel):
+    id: int
+    chat_id: int
+    content: str
+    sender: str
+    image_data: Optional[str] = None
+    image_url: Optional[str] = None
+
+class MessagePage(BaseModel):
+    messages: List[MessagePageItem]
+    next_before_id: Optional[int] = None
+
+# --- Volltextsuche ---
+class SearchHit(BaseModel):
+    message_id: int
+    chat_id: int
+    chat_title: str
+    sender: str
+    # HTML-escaped, Treffer in <mark>...</mark>
+    snippet: str
+    rank: float
+
+class SearchResults(BaseModel):
+    results: List[SearchHit]
+    next_offset: Optional[int] = None
+
 class ChatBase(BaseModel):
     title: str
 
@@ -42,9 +69,41 @@ class ChatInfo(BaseModel):
     title: str
     is_pinned: bool
     ai_chat_id: int
+    message_count: int = 0
+    last_message_preview: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
     class Config:
         from_attributes = True
 
+class ChatSummary(BaseModel):
+    version: int
+    chat_count: int
+    pinned_count: int
+    message_count: int
+    last_message_preview: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+# --- Export/Import (NDJSON, eine Zeile pro Datensatz, siehe chatexport.py) ---
+class ExportChat(BaseModel):
+    type: Literal["chat"] = "chat"
+    id: int
+    title: str
+    is_pinned: bool = False
+    # Kein ai_chat_id: ältere Exporte enthalten ihn noch, unbekannte Felder ignoriert pydantic
+
+class ExportMessage(BaseModel):
+    type: Literal["message"] = "message"
+    chat_id: int
+    content: str
+    sender: str
+    image_data: Optional[str] = None
+
+class ImportResult(BaseModel):
+    chats: int
+    messages: int
+
 # --- NEUE PROFIL-SCHEMAS ---
 class ProfileBase(BaseModel):
     username: str
@@ -0,0 +1,80 @@
+# backend/search.py
+
+import re
+import html
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+
+# Die Indizes entstehen in Migration 4 (messages_fts über messages) und Migration 8 (message_archive_fts mit
+# dem Text archivierter Nachrichten, siehe archive.py). Gesucht wird in beiden, sortiert nach bm25.
+
+# Steuerzeichen als Markierung im Snippet: erst nach dem HTML-Escaping werden daraus <mark>-Tags
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+SNIPPET_TOKENS = 12
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_SEARCH_SQL = text(f"""
+    SELECT m.id AS message_id, m.chat_id, c.title AS chat_title, m.sender,
+           snippet(messages_fts, 0, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet,
+           bm25(messages_fts) AS rank
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN chats c ON c.id = m.chat_id
+    WHERE messages_fts MATCH :match
+      AND c.owner_id = :owner_id
+      AND (:chat_id IS NULL OR m.chat_id = :chat_id)
+    UNION ALL
+    SELECT message_archive_fts.rowid AS message_id, message_archive_fts.chat_id, c.title AS chat_title,
+           message_archive_fts.sender,
+           snippet(message_archive_fts, 0, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet,
+           bm25(message_archive_fts) AS rank
+    FROM message_archive_fts
+    JOIN chats c ON c.id = message_archive_fts.chat_id
+    WHERE message_archive_fts MATCH :match
+      AND c.owner_id = :owner_id
+      AND (:chat_id IS NULL OR message_archive_fts.chat_id = :chat_id)
+    ORDER BY rank, message_id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Übersetzt Benutzereingaben in einen FTS5-Ausdruck ohne Syntaxfehler: jedes Wort wird als
+    Phrase zitiert (implizites AND), das letzte Wort matcht als Präfix ("such" findet "suchen").
+    """
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _render_snippet(raw: str) -> str:
+    escaped = html.escape(raw, quote=False)
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+async def search_messages(db: AsyncSession, owner_id: int, query: str, limit: int, offset: int,
+                          chat_id: Optional[int] = None) -> schemas.SearchResults:
+    match = build_match_query(query)
+    if match is None:
+        return schemas.SearchResults(results=[])
+    result = await db.execute(_SEARCH_SQL, {
+        "match": match, "owner_id": owner_id, "chat_id": chat_id, "limit": limit + 1, "offset": offset,
+    })
+    rows = result.all()
+    hits: List[schemas.SearchHit] = [
+        schemas.SearchHit(message_id=row.message_id, chat_id=row.chat_id, chat_title=row.chat_title,
+                          sender=row.sender, snippet=_render_snippet(row.snippet), rank=row.rank)
+        for row in rows[:limit]
+    ]
+    next_offset = offset + limit if len(rows) > limit else None
+    return schemas.SearchResults(results=hits, next_offset=next_offset)
@@ -0,0 +1,67 @@
+# backend/serve.py
+
+# Startet coldNet mit mehreren uvicorn-Workern auf einem Rechner:
+#
+#   python -m backend.serve --port 8080                 (ein Worker pro Kern)
+#   COLDNET_WORKERS=4 python -m backend.serve
+#   python -m backend.serve --convert-vacuum            (Wartung bei gestopptem Server, siehe archive.py)
+#
+# Tabellen und Migrationen werden einmal hier angelegt, bevor die Worker starten; die Worker selbst
+# (siehe lifespan in main.py) bauen nur ihre eigenen Engines, Caches und Hintergrund-Tasks auf.
+# SQLite erlaubt nur einen Schreiber gleichzeitig: mehr Worker helfen bei CPU-Arbeit (JSON, Kompression,
+# bcrypt, Bildverarbeitung), nicht beim Schreibdurchsatz.
+# Der TTS-Cache teilt sich das Verzeichnis, aber jeder Worker zählt nur die Dateien in seinem eigenen Index:
+# das Verzeichnis kann bis zu Worker-Anzahl × TTS_CACHE_MAX_BYTES groß werden (siehe ttscache.py).
+
+import os
+import argparse
+
+import uvicorn
+
+
+def default_workers() -> int:
+    """Anzahl der Kerne, die dieser Prozess nutzen darf (berücksichtigt CPU-Affinität/cgroups-cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def prepare_schema():
+    from .database import Base, engine
+    from . import migrations, models  # noqa: F401 (registriert die Tabellen)
+
+    Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    # Keine Verbindungen an die Worker vererben
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="coldNet-Backend mit mehreren Worker-Prozessen")
+    parser.add_argument("--host", default=os.getenv("COLDNET_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("COLDNET_PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("COLDNET_WORKERS", "0")),
+                        help="0 = ein Worker pro Kern")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--convert-vacuum", action="store_true",
+                        help="Datenbank einmalig auf auto_vacuum=INCREMENTAL umstellen und beenden")
+    args = parser.parse_args()
+
+    if args.convert_vacuum:
+        prepare_schema()
+        from . import archive
+        print(f"{archive.convert_auto_vacuum()} Seiten freigegeben.")
+        return
+
+    workers = args.workers if args.workers > 0 else default_workers()
+    # Vor dem Import von backend setzen: die Limits pro Prozess (Upstream, bcrypt) richten sich nach der
+    # Anzahl Worker, die Worker übernehmen die Umgebung
+    os.environ["COLDNET_WORKERS"] = str(workers)
+    prepare_schema()
+    os.environ["COLDNET_SCHEMA_READY"] = "1"
+    print(f"Starte {workers} Worker auf {args.host}:{args.port}")
+    uvicorn.run("backend.main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+# backend/sse.py
+
+import json
+from typing import Any
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Reverse-Proxies (nginx) sollen Events nicht puffern
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
@@ -0,0 +1,200 @@
+# backend/ttscache.py
+
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# --- Konfiguration ---
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(".", "tts_cache"))
+# Limit pro Prozess: mit mehreren Workern (serve.py) hat jeder einen eigenen Index über das gemeinsame
+# Verzeichnis und verdrängt nur die Einträge darin. Auf der Platte können so bis zu Worker-Anzahl ×
+# TTS_CACHE_MAX_BYTES liegen; für eine feste Obergrenze entsprechend kleiner setzen.
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(params: dict) -> str:
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Inhaltsadressierter Audio-Cache auf der Platte mit Größenlimit und LRU-Verdrängung.
+    Je Eintrag gibt es <key>.audio und <key>.type (Content-Type). Gleichzeitige Misses für denselben
+    Key teilen sich eine einzige Synthese beim AI-Server.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()  # key -> (size, media_type)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def audio_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _type_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.type")
+
+    def load(self):
+        """Baut den Index aus dem Cache-Verzeichnis auf (älteste Zugriffe zuerst)."""
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".audio"):
+                continue
+            key = name[:-len(".audio")]
+            try:
+                stat = os.stat(self.audio_path(key))
+                with open(self._type_path(key), "r", encoding="utf-8") as f:
+                    media_type = f.read().strip()
+            except OSError:
+                self._remove_files(key)
+                continue
+            found.append((stat.st_mtime, key, stat.st_size, media_type))
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            for _, key, size, media_type in sorted(found):
+                self._entries[key] = (size, media_type)
+                self._total_bytes += size
+        self._evict()
+
+    async def lookup(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Gibt (Audio, Content-Type) zurück, falls der Eintrag vorhanden ist, und markiert ihn als zuletzt benutzt."""
+        return await asyncio.to_thread(self._read, key)
+
+    def _read(self, key: str) -> Optional[Tuple[bytes, str]]:
+        # Die Bytes werden vollständig gelesen, bevor die Antwort rausgeht: eine gleichzeitige Verdrängung
+        # (auch durch einen anderen Worker) kann die Datei löschen, ohne dass die Auslieferung scheitert
+        with self._lock:
+            entry = self._entries.get(key)
+        try:
+            with open(self.audio_path(key), "rb") as f:
+                data = f.read()
+            if entry is not None:
+                media_type = entry[1]
+            else:
+                # Evtl. von einem anderen Worker-Prozess erzeugt (gemeinsames Verzeichnis, eigener Index)
+                with open(self._type_path(key), "r", encoding="utf-8") as f:
+                    media_type = f.read().strip()
+            os.utime(self.audio_path(key))
+        except OSError:
+            if entry is not None:
+                with self._lock:
+                    self._drop(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = (len(data), media_type)
+                self._total_bytes += len(data)
+            self.hits += 1
+        if entry is None:
+            self._evict(keep=key)
+        return data, media_type
+
+    async def get_or_create(self, key: str,
+                            produce: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[bytes, str]:
+        """Liefert (Audio, Content-Type) des ggf. neu erzeugten Eintrags."""
+        cached = await self.lookup(key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Eigener Task statt im Aufrufer: bricht dessen Request ab, laufen Synthese und Speichern für die
+            # übrigen Wartenden weiter
+            task = asyncio.create_task(self._create(key, produce))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    async def _create(self, key: str, produce: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[bytes, str]:
+        data, media_type = await produce()
+        await asyncio.to_thread(self._store, key, data, media_type)
+        return data, media_type
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Verhindert "Task exception was never retrieved", wenn niemand mehr wartet
+            task.exception()
+
+    def _store(self, key: str, data: bytes, media_type: str):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with open(self._type_path(key), "w", encoding="utf-8") as f:
+                f.write(media_type)
+            os.replace(tmp_path, self.audio_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (len(data), media_type)
+            self._total_bytes += len(data)
+        self._evict(keep=key)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[0]
+
+    def _remove_files(self, key: str):
+        for path in (self.audio_path(key), self._type_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # z.B. unter Windows, solange die Datei gelesen wird; load() nimmt sie beim nächsten Start wieder auf
+                print(f"TTS-Cache: {path} konnte nicht entfernt werden: {e}")
+
+    def _evict(self, keep: Optional[str] = None):
+        victims = []
+        with self._lock:
+            for key in list(self._entries):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._drop(key)
+                victims.append(key)
+                self.evictions += 1
+        for key in victims:
+            self._remove_files(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+
+tts_cache = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
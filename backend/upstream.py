@@ -0,0 +1,78 @@
+# backend/upstream.py
+
+import os
+import importlib.util
+from typing import Optional
+
+import httpx
+
+# --- Konfiguration ---
+AI_SERVER_URL = os.getenv("AI_SERVER_URL", "http://127.0.0.1:8000")
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+# HTTP/2 braucht das optionale Paket "h2" (pip install httpx[http2]).
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# Timeouts pro Route (Sekunden); None = kein Lese-Timeout (Streaming).
+ROUTE_TIMEOUTS = {
+    "default": 60.0,
+    "stt": 60.0,
+    "tts": 60.0,
+    "describe_image": 60.0,
+    "create_chat": 30.0,
+    "message": 60.0,
+    # Beim Streaming gilt der Lese-Timeout pro Chunk, nicht für die ganze Antwort
+    "message_stream": 60.0,
+    "sync": 30.0,
+    "stream_audio": None,
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def timeout_for(route: str) -> httpx.Timeout:
+    seconds = ROUTE_TIMEOUTS.get(route, ROUTE_TIMEOUTS["default"])
+    return httpx.Timeout(seconds, connect=UPSTREAM_CONNECT_TIMEOUT)
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+async def start_client() -> httpx.AsyncClient:
+    """Erstellt den gemeinsamen Client für alle Aufrufe an den AI-Server."""
+    global _client
+    if _client is not None:
+        return _client
+    http2 = UPSTREAM_HTTP2
+    if http2 and not _http2_available():
+        print("UPSTREAM_HTTP2 ist gesetzt, aber 'h2' ist nicht installiert. Nutze HTTP/1.1.")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    _client = httpx.AsyncClient(
+        base_url=AI_SERVER_URL,
+        limits=limits,
+        timeout=timeout_for("default"),
+        http2=http2,
+    )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Upstream client not started; is the app lifespan running?")
+    return _client
@@ -0,0 +1,73 @@
+# backend/usercache.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# --- Konfiguration ---
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Die Felder, die für die Autorisierung gebraucht werden (kein Profilbild, kein Passwort-Hash)."""
+    id: int
+    username: str
+
+
+class UserCache:
+    """In-Process-Cache für CurrentUser, nach Token-Subject (Username), mit TTL und LRU-Verdrängung."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CurrentUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, username: str) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: CurrentUser):
+        with self._lock:
+            self._entries[user.username] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+user_cache = UserCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
@@ -0,0 +1,66 @@
+# backend/workers.py
+
+import os
+from typing import Optional
+
+from .database import DATABASE_PATH
+
+try:
+    import fcntl
+except ImportError:  # fcntl gibt es nur unter Unix; ohne wird ein einzelner Prozess angenommen
+    fcntl = None
+
+# Mehrere uvicorn-Worker auf einem Rechner (siehe serve.py). Jeder Worker hat eigene Engines, Caches und
+# Hintergrund-Tasks; ProcessLock sorgt dafür, dass Hintergrundjobs (Archivierung, Chat-Pool) nur in einem
+# Worker gleichzeitig laufen. Einen Kanal für Cache-Invalidierungen braucht es nicht: der User-Cache hält nur
+# unveränderliche (id, username)-Paare, die Chat-Liste ist über chat_summaries.version in der DB versioniert.
+
+# --- Konfiguration ---
+# Anzahl Worker-Prozesse der Installation; setzt serve.py, Limits pro Prozess werden daraus abgeleitet
+WORKERS = max(1, int(os.getenv("COLDNET_WORKERS", "1")))
+# Schema/Migrationen hat der Launcher bereits vor dem Start der Worker ausgeführt
+SCHEMA_READY = os.getenv("COLDNET_SCHEMA_READY", "0") == "1"
+LOCK_DIR = os.getenv("COLDNET_LOCK_DIR", os.path.dirname(os.path.abspath(DATABASE_PATH)))
+
+
+def per_worker(total: int) -> int:
+    """Teilt ein Limit für die ganze Installation auf die Worker auf (aufgerundet, mindestens 1)."""
+    return max(1, -(-total // WORKERS))
+
+
+class ProcessLock:
+    """
+    Nicht blockierender Datei-Lock (flock) neben der Datenbank. Stirbt der Halter, gibt das Betriebssystem
+    den Lock frei und ein anderer Worker übernimmt beim nächsten Versuch.
+    """
+
+    def __init__(self, name: str):
+        self.path = os.path.join(LOCK_DIR, f".coldnet-{name}.lock")
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None or WORKERS == 1:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,294 @@
+# benchmarks/loadtest.py
+
+# Lasttest für backend.main:app. Jeder virtuelle Benutzer registriert sich, meldet sich an, legt einen
+# Chat an und schickt dann Nachrichten (normal und per SSE), synchronisiert und streamt Audio.
+#
+# Alles lokal starten (Stub-AI-Server + Backend mit frischer Datenbank in einem Temp-Verzeichnis):
+#   python -m benchmarks.loadtest --spawn --users 20 --iterations 5
+# Mit mehreren Worker-Prozessen (über backend.serve, 0 = ein Worker pro Kern):
+#   python -m benchmarks.loadtest --spawn --workers 0 --users 50
+# Gegen ein laufendes Backend:
+#   python -m benchmarks.loadtest --base-url http://127.0.0.1:8100 --users 20
+#
+# Ausgabe: p50/p95/p99 Latenz und Time-to-first-byte je Operation sowie Requests pro Sekunde.
+# Mit --json wird das Ergebnis zusätzlich gespeichert, um Regressionen zwischen Läufen zu vergleichen.
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class OpStats:
+    latencies: List[float] = field(default_factory=list)
+    ttfbs: List[float] = field(default_factory=list)
+    errors: int = 0
+    # 503 mit Retry-After (Admission Control, bcrypt-Limit): wird wiederholt und extra gezählt
+    rejected: int = 0
+
+
+class Recorder:
+    def __init__(self):
+        self.ops: Dict[str, OpStats] = {}
+        self.error_samples: List[str] = []
+
+    def reject(self, op: str):
+        self.ops.setdefault(op, OpStats()).rejected += 1
+
+    def record(self, op: str, latency: float, ttfb: Optional[float], ok: bool, detail: str = ""):
+        stats = self.ops.setdefault(op, OpStats())
+        stats.latencies.append(latency)
+        if ttfb is not None:
+            stats.ttfbs.append(ttfb)
+        if not ok:
+            stats.errors += 1
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{op}: {detail}")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank-Perzentil; pct in 0..100."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+async def timed(client: httpx.AsyncClient, rec: Recorder, op: str, method: str, url: str,
+                expect: int = 200, max_retries: int = 5, **kwargs) -> Optional[bytes]:
+    """Führt einen Request aus; TTFB = Zeit bis zum ersten Body-Byte (bei Streams der erste Token/Frame)."""
+    for _ in range(max_retries + 1):
+        start = time.perf_counter()
+        ttfb = None
+        body = bytearray()
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                async for chunk in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    body += chunk
+                status = response.status_code
+                retry_after = response.headers.get("retry-after")
+        except httpx.HTTPError as e:
+            rec.record(op, time.perf_counter() - start, ttfb, False, repr(e))
+            return None
+        if status != 503 or retry_after is None:
+            break
+        rec.reject(op)
+        # Mit Jitter, sonst kommen alle abgewiesenen Benutzer gleichzeitig wieder
+        await asyncio.sleep(float(retry_after) * random.uniform(1, 2))
+    ok = status == expect
+    rec.record(op, time.perf_counter() - start, ttfb, ok, f"HTTP {status} {bytes(body[:200])!r}")
+    return bytes(body) if ok else None
+
+
+async def virtual_user(client: httpx.AsyncClient, rec: Recorder, args: argparse.Namespace):
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    password = "bench-password"
+    if await timed(client, rec, "register", "POST", "/api/register",
+                   json={"username": username, "password": password}) is None:
+        return
+    body = await timed(client, rec, "login", "POST", "/api/token",
+                       data={"username": username, "password": password})
+    if body is None:
+        return
+    headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+
+    body = await timed(client, rec, "create_chat", "POST", "/api/chats", expect=201, headers=headers)
+    if body is None:
+        return
+    chat_id = json.loads(body)["id"]
+
+    for i in range(args.iterations):
+        prompt = {"final_prompt": f"Frage {i} von {username}", "user_text": f"Frage {i}"}
+        await timed(client, rec, "message", "POST", f"/api/chats/{chat_id}/messages", json=prompt, headers=headers)
+        if not args.skip_stream:
+            await timed(client, rec, "message_stream", "POST", f"/api/chats/{chat_id}/messages/stream",
+                        json=prompt, headers=headers)
+        await timed(client, rec, "sync", "POST", f"/api/chats/{chat_id}/sync", expect=204, headers=headers)
+        if not args.skip_audio:
+            await timed(client, rec, "stream_audio", "POST", f"/api/chats/{chat_id}/messages/stream-audio",
+                        json={"role": "user", "content": f"Sprachfrage {i}"}, headers=headers)
+        await timed(client, rec, "list_chats", "GET", "/api/chats", headers=headers)
+        await timed(client, rec, "read_chat", "GET", f"/api/chats/{chat_id}", headers=headers)
+        await timed(client, rec, "messages_page", "GET", f"/api/chats/{chat_id}/messages", headers=headers)
+
+
+async def run_load(base_url: str, args: argparse.Namespace) -> dict:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        semaphore = asyncio.Semaphore(args.concurrency or args.users)
+
+        async def one_user(index: int):
+            await asyncio.sleep(args.ramp_up * index / args.users)
+            async with semaphore:
+                await virtual_user(client, rec, args)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_user(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    return summarize(rec, elapsed, args)
+
+
+def summarize(rec: Recorder, elapsed: float, args: argparse.Namespace) -> dict:
+    ops = {}
+    for op, stats in rec.ops.items():
+        ops[op] = {
+            "count": len(stats.latencies),
+            "errors": stats.errors,
+            "rejected": stats.rejected,
+            "p50_ms": percentile(stats.latencies, 50) * 1000,
+            "p95_ms": percentile(stats.latencies, 95) * 1000,
+            "p99_ms": percentile(stats.latencies, 99) * 1000,
+            "max_ms": max(stats.latencies) * 1000,
+            # Antworten ohne Body (204) haben keine TTFB
+            "ttfb_p50_ms": percentile(stats.ttfbs, 50) * 1000 if stats.ttfbs else None,
+            "ttfb_p95_ms": percentile(stats.ttfbs, 95) * 1000 if stats.ttfbs else None,
+            "rps": len(stats.latencies) / elapsed if elapsed else 0.0,
+        }
+    total = sum(op["count"] for op in ops.values())
+    return {
+        "users": args.users,
+        "iterations": args.iterations,
+        "elapsed_s": elapsed,
+        "requests": total,
+        "errors": sum(op["errors"] for op in ops.values()),
+        "rejected": sum(op["rejected"] for op in ops.values()),
+        "rps": total / elapsed if elapsed else 0.0,
+        "ops": ops,
+        "error_samples": rec.error_samples,
+    }
+
+
+def print_report(result: dict):
+    columns = ("count", "errors", "rejected", "p50_ms", "p95_ms", "p99_ms", "max_ms", "ttfb_p50_ms", "ttfb_p95_ms", "rps")
+    print(f"{'operation':<16}" + "".join(f"{c:>12}" for c in columns))
+    for op, values in result["ops"].items():
+        cells = []
+        for c in columns:
+            value = values[c]
+            if value is None:
+                cells.append(f"{'-':>12}")
+            elif isinstance(value, int):
+                cells.append(f"{value:>12d}")
+            else:
+                cells.append(f"{value:>12.1f}")
+        print(f"{op:<16}" + "".join(cells))
+    print(f"\n{result['requests']} requests in {result['elapsed_s']:.2f}s "
+          f"({result['rps']:.1f} req/s), {result['errors']} errors, {result['rejected']} rejected with 503")
+    for sample in result["error_samples"]:
+        print(f"  ! {sample}")
+
+
+# --- Lokale Server ---
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def spawned_servers(args: argparse.Namespace) -> Iterator[str]:
+    """Startet Stub-AI-Server und Backend als eigene Prozesse mit frischem Datenverzeichnis."""
+    workdir = tempfile.mkdtemp(prefix="coldnet-bench-")
+    stub_port, app_port = _free_port(), _free_port()
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    stub_env = dict(env, STUB_LATENCY_MS=str(args.stub_latency_ms))
+    app_env = dict(
+        env,
+        AI_SERVER_URL=f"http://127.0.0.1:{stub_port}",
+        COLDNET_DB_PATH=os.path.join(workdir, "bench.db"),
+        BLOB_DIR=os.path.join(workdir, "blobs"),
+        TTS_CACHE_DIR=os.path.join(workdir, "tts_cache"),
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    processes = []
+    try:
+        stub = subprocess.Popen(uvicorn + ["--port", str(stub_port), "benchmarks.stub_ai_server:app"],
+                                env=stub_env, cwd=PROJECT_ROOT)
+        processes.append(stub)
+        _wait_until_up(f"http://127.0.0.1:{stub_port}/docs", stub)
+        if args.workers == 1:
+            command = uvicorn + ["--port", str(app_port), "backend.main:app"]
+        else:
+            command = [sys.executable, "-m", "backend.serve", "--host", "127.0.0.1", "--port", str(app_port),
+                       "--workers", str(args.workers), "--log-level", "warning"]
+        backend = subprocess.Popen(command, env=app_env, cwd=workdir)
+        processes.append(backend)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/docs", backend)
+        print(f"Stub-AI-Server :{stub_port}, Backend :{app_port}, Daten in {workdir}")
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test for the coldNet backend")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100")
+    parser.add_argument("--spawn", action="store_true", help="start the stub AI server and backend locally")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="backend worker processes when using --spawn (0 = one per core)")
+    parser.add_argument("--stub-latency-ms", type=float, default=50, help="AI stub latency when using --spawn")
+    parser.add_argument("--users", type=int, default=10, help="number of virtual users")
+    parser.add_argument("--concurrency", type=int, default=0, help="max users active at once (default: all)")
+    parser.add_argument("--iterations", type=int, default=5, help="message rounds per user")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds over which users are started")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--skip-stream", action="store_true", help="skip the SSE message endpoint")
+    parser.add_argument("--skip-audio", action="store_true", help="skip the audio streaming endpoint")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.spawn:
+        with spawned_servers(args) as base_url:
+            result = asyncio.run(run_load(base_url, args))
+    else:
+        result = asyncio.run(run_load(args.base_url, args))
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# benchmarks/serialization.py
+
+# Vergleicht den bisherigen Antwortpfad für GET /api/chats/{id} und GET /api/chats (ORM-Objekte ->
+# Pydantic from_attributes -> json) mit dem schnellen Pfad (Spalten-Tupel -> orjson -> gzip/br).
+# Läuft gegen eine frische SQLite-Datenbank in einem Temp-Verzeichnis:
+#
+#   python -m benchmarks.serialization --messages 500 --image-every 5 --image-kb 64
+#
+# Gemessen wird pro Aufruf: Query + Aufbereitung + Serialisierung (+ Kompression), sowie die Body-Größe.
+
+import os
+import sys
+import time
+import base64
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from typing import Awaitable, Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _fake_request(accept_encoding: str):
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                    "headers": [(b"accept-encoding", accept_encoding.encode())]})
+
+
+def _populate(chats: int, messages: int, image_every: int, image_kb: int) -> int:
+    from backend import models
+    from backend.database import SessionLocal
+
+    rng = random.Random(42)
+    image = "data:image/jpeg;base64," + base64.b64encode(rng.randbytes(image_kb * 1024)).decode()
+    words = ["Kälte", "Netz", "Bild", "Szene", "Frage", "Antwort", "coldBot", "Himmel", "Licht", "Straße"]
+    with SessionLocal() as db:
+        user = models.User(username="bench", hashed_password="-")
+        db.add(user)
+        db.flush()
+        for c in range(chats):
+            chat = models.Chat(title=f"AI Chat #{c}", owner_id=user.id, ai_chat_id=c + 1, is_pinned=c < 3)
+            db.add(chat)
+            db.flush()
+        for i in range(messages):
+            # Altbestand mit Base64 direkt in der Nachricht: der teuerste Fall für den bisherigen Pfad
+            db.add(models.Message(
+                chat_id=chat.id,
+                sender="user" if i % 2 == 0 else "coldBot",
+                content=" ".join(rng.choice(words) for _ in range(rng.randint(5, 60))),
+                image_data_inline=image if image_every and i % image_every == 0 else None,
+            ))
+        db.commit()
+        return user.id, chat.id
+
+
+async def _time(fn: Callable[[], Awaitable[int]], rounds: int) -> Dict[str, float]:
+    await fn()  # Aufwärmen (Statement-Cache, Pydantic-Schemas)
+    samples: List[float] = []
+    size = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = await fn()
+        samples.append(time.perf_counter() - start)
+    return {"mean": statistics.mean(samples), "p50": statistics.median(samples), "bytes": size}
+
+
+async def run(args):
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    from backend import crud_async, fastresponse, schemas
+    from backend.database import AsyncSessionLocal, Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    owner_id, chat_id = _populate(args.chats, args.messages, args.image_every, args.image_kb)
+    chat_list_adapter = TypeAdapter(List[schemas.ChatInfo])
+
+    # Bisheriger Pfad, so wie FastAPI ihn mit response_model ausführt: validieren, serialisieren, json.dumps
+    async def history_current():
+        async with AsyncSessionLocal() as db:
+            chat = await crud_async.get_chat_with_messages(db, chat_id=chat_id, owner_id=owner_id)
+            content = schemas.Chat.model_validate(chat).model_dump(mode="json")
+        return len(JSONResponse(content).body)
+
+    async def list_current():
+        async with AsyncSessionLocal() as db:
+            chats = await crud_async.get_chats_by_owner(db, owner_id=owner_id)
+            content = chat_list_adapter.dump_python(chat_list_adapter.validate_python(chats, from_attributes=True),
+                                                    mode="json")
+        return len(JSONResponse(content).body)
+
+    def fast(load, accept_encoding: str):
+        request = _fake_request(accept_encoding)
+
+        async def call():
+            async with AsyncSessionLocal() as db:
+                content = await load(db)
+            response = await fastresponse.FastJSONResponse(content).compress_for(request)
+            return len(response.body)
+        return call
+
+    # Gleicher Inhalt wie vorher, sonst ist der Vergleich wertlos
+    async with AsyncSessionLocal() as db:
+        chat = await crud_async.get_chat_with_messages(db, chat_id=chat_id, owner_id=owner_id)
+        expected = schemas.Chat.model_validate(chat).model_dump(mode="json")
+        assert expected == await crud_async.get_chat_history_payload(db, chat_id=chat_id, owner_id=owner_id)
+
+    load_history = lambda db: crud_async.get_chat_history_payload(db, chat_id=chat_id, owner_id=owner_id)
+    load_list = lambda db: crud_async.get_chat_list_payload(db, owner_id=owner_id)
+    cases = [
+        ("history current", history_current),
+        ("history fast", fast(load_history, "identity")),
+        ("history fast+gzip", fast(load_history, "gzip")),
+    ]
+    if "br" in fastresponse.available_encodings():
+        cases.append(("history fast+br", fast(load_history, "br, gzip")))
+    cases += [
+        ("list current", list_current),
+        ("list fast", fast(load_list, "identity")),
+        ("list fast+gzip", fast(load_list, "gzip")),
+    ]
+
+    print(f"{args.messages} Nachrichten (jede {args.image_every}. mit {args.image_kb} KiB Bild), {args.chats} Chats, "
+          f"orjson={'ja' if fastresponse.orjson is not None else 'nein'}, {args.rounds} Runden")
+    print(f"{'case':<20} {'mean':>9} {'p50':>9} {'bytes':>11}")
+    for name, fn in cases:
+        result = await _time(fn, args.rounds)
+        print(f"{name:<20} {result['mean'] * 1000:>7.2f}ms {result['p50'] * 1000:>7.2f}ms {result['bytes']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--image-every", type=int, default=5, help="0 = keine Bilder")
+    parser.add_argument("--image-kb", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="coldnet-serialization-") as tmp:
+        # Vor dem Import von backend setzen, die Engines werden beim Import angelegt
+        os.environ["COLDNET_DB_PATH"] = os.path.join(tmp, "bench.db")
+        sys.path.insert(0, PROJECT_ROOT)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/stub_ai_server.py
+
+# Lokaler Ersatz für den AI-Server mit einstellbarer Latenz, damit Lasttests nur das Backend messen.
+#
+#   STUB_LATENCY_MS=50 uvicorn benchmarks.stub_ai_server:app --port 8000
+#
+# Latenz pro Endpunkt: STUB_LATENCY_<NAME>_MS mit NAME in CREATE_CHAT, HISTORY, MESSAGE, STREAM,
+# STREAM_AUDIO, TTS, STT, DESCRIBE_IMAGE. STUB_JITTER_MS streut zufällig um den Wert.
+# Streaming-Endpunkte warten STUB_TOKEN_DELAY_MS bzw. STUB_FRAME_DELAY_MS zwischen den Stücken.
+
+import io
+import os
+import wave
+import random
+import struct
+import asyncio
+import itertools
+from typing import Dict, List
+
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "0"))
+STUB_TOKEN_DELAY_MS = float(os.getenv("STUB_TOKEN_DELAY_MS", "20"))
+STUB_FRAME_DELAY_MS = float(os.getenv("STUB_FRAME_DELAY_MS", "50"))
+STUB_AUDIO_FRAMES = int(os.getenv("STUB_AUDIO_FRAMES", "3"))
+# Länge eines Audio-Frames (16 kHz, mono, 16 bit)
+STUB_FRAME_SECONDS = float(os.getenv("STUB_FRAME_SECONDS", "0.5"))
+
+app = FastAPI(title="coldNet AI stub")
+
+_chats: Dict[int, List[dict]] = {}
+_chat_ids = itertools.count(1)
+
+
+async def _delay(name: str):
+    base = float(os.getenv(f"STUB_LATENCY_{name}_MS", str(STUB_LATENCY_MS)))
+    jitter = random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS) if STUB_JITTER_MS else 0.0
+    seconds = max(0.0, base + jitter) / 1000
+    if seconds:
+        await asyncio.sleep(seconds)
+
+
+def _silence_wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\0\0" * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+_FRAME = _silence_wav(STUB_FRAME_SECONDS)
+
+
+def _reply_to(content: str) -> str:
+    return f"Stub reply to: {content}"
+
+
+@app.post("/chats/")
+async def create_chat():
+    await _delay("CREATE_CHAT")
+    chat_id = next(_chat_ids)
+    _chats[chat_id] = []
+    return {"id": chat_id}
+
+
+@app.get("/chats/{chat_id}/messages/")
+async def read_history(chat_id: int):
+    await _delay("HISTORY")
+    return _chats.get(chat_id, [])
+
+
+@app.post("/chats/{chat_id}/messages/")
+async def create_message(chat_id: int, request: Request):
+    payload = await request.json()
+    await _delay("MESSAGE")
+    history = _chats.setdefault(chat_id, [])
+    history.append({"role": "user", "content": payload.get("content", ""), "image_base64": payload.get("image_base64")})
+    reply = {"role": "assistant", "content": _reply_to(payload.get("content", ""))}
+    history.append(reply)
+    return reply
+
+
+@app.post("/chats/{chat_id}/messages/stream")
+async def stream_message(chat_id: int, request: Request):
+    payload = await request.json()
+    await _delay("STREAM")
+    reply = _reply_to(payload.get("content", ""))
+    history = _chats.setdefault(chat_id, [])
+    history.append({"role": "user", "content": payload.get("content", "")})
+    history.append({"role": "assistant", "content": reply})
+
+    async def tokens():
+        for i, word in enumerate(reply.split(" ")):
+            if i:
+                await asyncio.sleep(STUB_TOKEN_DELAY_MS / 1000)
+            yield word if i == 0 else " " + word
+
+    return StreamingResponse(tokens(), media_type="text/plain")
+
+
+@app.post("/chats/{chat_id}/messages/stream-audio")
+async def stream_audio(chat_id: int, request: Request):
+    payload = await request.json()
+    await _delay("STREAM_AUDIO")
+    history = _chats.setdefault(chat_id, [])
+    history.append({"role": "user", "content": payload.get("content", "")})
+    history.append({"role": "assistant", "content": _reply_to(payload.get("content", ""))})
+
+    async def frames():
+        for i in range(STUB_AUDIO_FRAMES):
+            if i:
+                await asyncio.sleep(STUB_FRAME_DELAY_MS / 1000)
+            yield struct.pack(">I", len(_FRAME)) + _FRAME
+
+    return StreamingResponse(frames(), media_type="application/octet-stream")
+
+
+@app.post("/tts/synthesize")
+async def synthesize(request: Request):
+    await request.json()
+    await _delay("TTS")
+    return Response(_FRAME, media_type="audio/wav")
+
+
+@app.post("/stt/transcribe")
+async def transcribe(file: UploadFile = File(...)):
+    data = await file.read()
+    await _delay("STT")
+    return {"text": f"transcribed {len(data)} bytes"}
+
+
+@app.post("/describe-image/")
+async def describe_image(file: UploadFile = File(...)):
+    data = await file.read()
+    await _delay("DESCRIBE_IMAGE")
+    return {"description": f"an image of {len(data)} bytes"}
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Vor dem Import von backend setzen: Datenbank, Blobs und TTS-Cache der Tests liegen in einem Temp-Verzeichnis
+_TMP = tempfile.mkdtemp(prefix="coldnet-tests-")
+os.environ.setdefault("COLDNET_DB_PATH", os.path.join(_TMP, "coldnet.db"))
+os.environ.setdefault("BLOB_DIR", os.path.join(_TMP, "blobs"))
+os.environ.setdefault("TTS_CACHE_DIR", os.path.join(_TMP, "tts_cache"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
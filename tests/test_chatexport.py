@@ -0,0 +1,46 @@
+import asyncio
+import gzip
+import tracemalloc
+
+import pytest
+
+from backend import chatexport
+
+
+async def _records(body: bytes, compressed: bool, chunk_size: int = 64 * 1024):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    return [record async for record in chatexport._ndjson_records(chunks(), compressed)]
+
+
+def test_gzip_lines_are_split(monkeypatch):
+    monkeypatch.setattr(chatexport, "IMPORT_MAX_LINE_BYTES", 1024)
+    # Insgesamt weit über dem Limit, jede Zeile darunter
+    lines = [b'{"type": "message", "n": %d}' % i for i in range(5000)]
+    records = asyncio.run(_records(gzip.compress(b"\n".join(lines)), compressed=True))
+    assert [line for _, line in records] == lines
+    assert records[-1][0] == len(lines)
+
+
+def test_gzip_bomb_is_rejected_before_inflating(monkeypatch):
+    limit = 1024 * 1024
+    monkeypatch.setattr(chatexport, "IMPORT_MAX_LINE_BYTES", limit)
+    # ~200 KB gzip, entpackt 200 MB ohne Zeilenumbruch
+    bomb = gzip.compress(b"a" * (200 * 1024 * 1024), compresslevel=9)
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(chatexport.ChatImportError):
+            asyncio.run(_records(bomb, compressed=True, chunk_size=len(bomb)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 8 * limit
+
+
+def test_uncompressed_line_limit(monkeypatch):
+    monkeypatch.setattr(chatexport, "IMPORT_MAX_LINE_BYTES", 1024)
+    with pytest.raises(chatexport.ChatImportError):
+        asyncio.run(_records(b"x" * 4096, compressed=False, chunk_size=512))
@@ -0,0 +1,67 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+
+from backend import blobstore, migrations
+from backend.database import Base
+
+# Schema von vor den Migrationen: Bilder liegen als Data-URL in messages.image_data / users.profile_picture
+BASELINE_SCHEMA = (
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, hashed_password VARCHAR, "
+    "real_name VARCHAR, birth_date DATE, profile_picture TEXT)",
+    "CREATE TABLE chats (id INTEGER PRIMARY KEY, title VARCHAR, owner_id INTEGER REFERENCES users(id), "
+    "is_pinned BOOLEAN NOT NULL, ai_chat_id INTEGER NOT NULL)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, content VARCHAR, sender VARCHAR, image_data TEXT, "
+    "chat_id INTEGER REFERENCES chats(id))",
+)
+
+
+def _data_url(image_format: str, media_type: str) -> str:
+    out = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(out, format=image_format)
+    return f"data:{media_type};base64,{base64.b64encode(out.getvalue()).decode('ascii')}"
+
+
+@pytest.fixture
+def baseline_engine(tmp_path, monkeypatch):
+    from backend import models  # noqa: F401 (registriert die Tabellen)
+
+    monkeypatch.setattr(blobstore, "BLOB_DIR", str(tmp_path / "blobs"))
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            conn.exec_driver_sql(ddl)
+    yield engine
+    engine.dispose()
+
+
+def test_unsupported_image_types_stay_inline(baseline_engine):
+    bmp = _data_url("BMP", "image/bmp")
+    png = _data_url("PNG", "image/png")
+    with baseline_engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO users (id, username, profile_picture) VALUES (1, 'a', ?)", (bmp,))
+        conn.exec_driver_sql("INSERT INTO chats (id, title, owner_id, is_pinned, ai_chat_id) VALUES (1, 'c', 1, 0, 1)")
+        conn.exec_driver_sql("INSERT INTO messages (id, content, sender, image_data, chat_id) "
+                             "VALUES (1, 'bmp', 'user', ?, 1)", (bmp,))
+        conn.exec_driver_sql("INSERT INTO messages (id, content, sender, image_data, chat_id) "
+                             "VALUES (2, 'png', 'user', ?, 1)", (png,))
+        # Abgeschnittenes PNG: gültiges Base64, aber kein lesbares Bild
+        conn.exec_driver_sql("INSERT INTO messages (id, content, sender, image_data, chat_id) "
+                             "VALUES (3, 'cut', 'user', ?, 1)", (png[:60],))
+
+    Base.metadata.create_all(bind=baseline_engine)
+    migrations.run_migrations(baseline_engine)
+
+    with baseline_engine.connect() as conn:
+        messages = conn.exec_driver_sql("SELECT id, image_data, image_hash FROM messages ORDER BY id").fetchall()
+        user = conn.exec_driver_sql("SELECT profile_picture, profile_picture_hash FROM users").one()
+        blobs = conn.exec_driver_sql("SELECT hash, media_type FROM blobs").fetchall()
+
+    assert messages[0] == (1, bmp, None)
+    assert messages[1][1] is None and messages[1][2] is not None
+    assert messages[2] == (3, png[:60], None)
+    assert user == (bmp, None)
+    assert blobs == [(messages[1][2], "image/png")]
@@ -0,0 +1,24 @@
+import asyncio
+import contextlib
+import json
+
+from backend import main, upstream
+
+
+def test_relay_reports_unexpected_upstream_errors(monkeypatch):
+    async def malformed_reply(client, ai_chat_id, ai_payload):
+        yield "partial "
+        json.loads("{not json")
+
+    monkeypatch.setattr(upstream, "get_client", lambda: None)
+    monkeypatch.setattr(main, "_ai_reply_chunks", malformed_reply)
+    payload = main.PromptPayload(final_prompt="hi", user_text="hi")
+
+    async def relay():
+        events: asyncio.Queue = asyncio.Queue()
+        await main._relay_text_stream(1, 1, payload, None, events, contextlib.nullcontext())
+        return [events.get_nowait() for _ in range(events.qsize())]
+
+    events = asyncio.run(relay())
+    assert events[0] == ("token", {"text": "partial "})
+    assert events[-1][0] == "error"